@@ -1,10 +1,43 @@
 import streamlit as st
-import cv2
 import numpy as np
 from PIL import Image
 import io
+import os
+import shutil
+import tempfile
+import threading
 import time
-import base64
+import uuid
+from collections import deque
+from pathlib import Path
+
+from engine import (
+    KERNELS,
+    OUTPUT_FORMATS,
+    OUTPUT_MODES,
+    CancelledJob,
+    ImageStore,
+    JobQueue,
+    QueueFull,
+    ResultCache,
+    append_to_zip,
+    apply_convolution,
+    cached_convolution,
+    cached_convolutions,
+    compile_kernel,
+    convolve_clip,
+    encode_image,
+    filter_upload,
+    get_sample_region_calculation,
+    image_digest,
+    load_kernel_file,
+    normalize_kernel,
+    parse_kernel_text,
+    resize_image_for_display,
+    result_key,
+    timing,
+)
+from engine.video import ANIMATION_EXTENSIONS, VIDEO_EXTENSIONS, output_suffix
 
 # Page configuration
 st.set_page_config(
@@ -14,6 +47,21 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Stage timings: PICUPG_DEBUG=1 or ?debug=1 shows a panel for the current
+# interaction, PICUPG_METRICS_FILE exports Prometheus text after every rerun
+METRICS_FILE = os.environ.get('PICUPG_METRICS_FILE') or None
+if METRICS_FILE:
+    timing.enable()
+SHOW_TIMINGS = bool(os.environ.get('PICUPG_DEBUG')) or st.query_params.get('debug') in ('1', 'true')
+if SHOW_TIMINGS:
+    # A recorder left over from a rerun that ended in st.rerun() keeps
+    # collecting, so a click and the rerun that shows its result are one table
+    if st.session_state.get('timing_recorder') is None:
+        st.session_state.timing_recorder = timing.Recorder()
+    timing.activate(st.session_state.timing_recorder)
+else:
+    timing.activate(None)
+
 # Custom CSS for professional, responsive design
 st.markdown("""
     <style>
@@ -371,8 +419,8 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize session state
-if 'processed_image' not in st.session_state:
-    st.session_state.processed_image = None
+if 'processed_key' not in st.session_state:
+    st.session_state.processed_key = None
 if 'kernel_used' not in st.session_state:
     st.session_state.kernel_used = None
 if 'filter_name' not in st.session_state:
@@ -383,90 +431,240 @@ if 'processing' not in st.session_state:
     st.session_state.processing = False
 if 'current_filter' not in st.session_state:
     st.session_state.current_filter = None
+if 'upload' not in st.session_state:
+    st.session_state.upload = None
+if 'processed_output' not in st.session_state:
+    st.session_state.processed_output = None
+if 'comparison' not in st.session_state:
+    st.session_state.comparison = None
+if 'output_mode' not in st.session_state:
+    st.session_state.output_mode = 'clip'
+if 'preview_image' not in st.session_state:
+    st.session_state.preview_image = None
+if 'pending_result' not in st.session_state:
+    st.session_state.pending_result = None
+if 'filter_error' not in st.session_state:
+    st.session_state.filter_error = None
+if 'session_key' not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex
+if 'clip_job' not in st.session_state:
+    st.session_state.clip_job = None
+if 'clip_result' not in st.session_state:
+    st.session_state.clip_result = None
+if 'batch' not in st.session_state:
+    st.session_state.batch = None
+if 'custom_kernels' not in st.session_state:
+    st.session_state.custom_kernels = {}
 
-# Define convolution kernels
-KERNELS = {
-    'blur': {
-        'matrix': np.ones((3, 3), dtype=np.float32) / 9,
-        'name': 'Blur (Averaging)',
-        'explanation': """
-        **How it works:** The blur filter uses a 3×3 averaging kernel where each element is 1/9. 
-        This means each pixel in the output is the average of its 8 neighbors plus itself.
-        
-        **Effect:** Creates a smoothing effect by reducing sharp transitions between pixels, 
-        useful for noise reduction and creating a softer appearance.
-        
-        **Formula:** New_Pixel = (Sum of 9 neighboring pixels) / 9
-        """,
-        'icon': '🌫️'
-    },
-    'sharpen': {
-        'matrix': np.array([
-            [-1, -1, -1],
-            [-1, 9, -1],
-            [-1, -1, -1]
-        ], dtype=np.float32),
-        'name': 'Sharpen',
-        'explanation': """
-        **How it works:** The sharpen kernel strongly emphasizes the center pixel (value: 9) while 
-        subtracting all 8 neighboring pixels (-1 each). This amplifies differences between the center 
-        pixel and its surroundings, creating a strong sharpening effect.
-        
-        **Effect:** Enhances edges and fine details significantly, making the image appear much crisper and more defined.
-        
-        **Formula:** New_Pixel = 9×Center - Sum(All 8 Neighbors)
-        """,
-        'icon': '✨'
-    },
-    'edge': {
-        'matrix': np.array([
-            [-1, -1, -1],
-            [-1, 8, -1],
-            [-1, -1, -1]
-        ], dtype=np.float32),
-        'name': 'Edge Detection (Laplacian)',
-        'explanation': """
-        **How it works:** The Laplacian kernel strongly emphasizes the center pixel (value: 8) 
-        while subtracting all 8 neighbors (-1 each). This highlights areas where pixel intensity 
-        changes rapidly.
-        
-        **Effect:** Detects edges and boundaries by finding regions of high intensity change, 
-        making edges appear bright against a dark background.
+# Files under ./static are served by Streamlit at app/static/ (see .streamlit/config.toml)
+STATIC_DIR = Path(__file__).parent / 'static'
+STATIC_URL = 'app/static'
+MAX_PUBLISHED_FILES = 200
+
+# Images above this many pixels are filtered in strips to bound peak memory
+TILED_PIXEL_THRESHOLD = 16_000_000
+TILE_ROWS = 512
+
+# Images above this many pixels are filtered on several cores
+PARALLEL_PIXEL_THRESHOLD = 4_000_000
+CONVOLUTION_WORKERS = int(os.environ.get('PICUPG_WORKERS', os.cpu_count() or 1))
+
+# In fast mode, images above this many pixels first show a display-size preview
+PROGRESSIVE_PIXEL_THRESHOLD = 2_000_000
+
+# Optional scratch directory for memory-mapped uploads and results
+SPILL_DIR = os.environ.get('PICUPG_SPILL_DIR') or None
+
+# Filter requests beyond this many queued jobs are turned away instead of piling up
+MAX_PENDING_JOBS = int(os.environ.get('PICUPG_MAX_PENDING_JOBS', '32'))
+
+# Starting points for the custom kernel editor
+CUSTOM_KERNEL_PRESETS = {
+    'Gaussian 5×5': "1 4 6 4 1\n4 16 24 16 4\n6 24 36 24 6\n4 16 24 16 4\n1 4 6 4 1",
+    'Sobel (horizontal edges)': "-1 -2 -1\n0 0 0\n1 2 1",
+    'Sobel (vertical edges)': "-1 0 1\n-2 0 2\n-1 0 1",
+    'Emboss': "-2 -1 0\n-1 1 1\n0 1 2",
+    'Motion blur 9×9': "\n".join(" ".join('1' if i == j else '0' for j in range(9)) for i in range(9)),
+}
+
+# A batch keeps at most this many of its images queued or running at once
+BATCH_JOBS_IN_FLIGHT = max(2, os.cpu_count() or 1)
+
+@st.cache_resource
+def get_result_cache():
+    """Process-wide convolution result cache shared by every session"""
+    disk_dir = os.environ.get('PICUPG_CACHE_DIR') or None
+    if disk_dir is None and SPILL_DIR is not None:
+        disk_dir = os.path.join(SPILL_DIR, 'results')
+    return ResultCache(
+        max_bytes=int(os.environ.get('PICUPG_CACHE_MB', '256')) * 1024 * 1024,
+        disk_dir=disk_dir,
+    )
+
+@st.cache_resource
+def get_image_store():
+    """Process-wide upload store; identical uploads share one entry"""
+    return ImageStore(
+        max_bytes=int(os.environ.get('PICUPG_STORE_MB', '512')) * 1024 * 1024,
+        spill_dir=os.path.join(SPILL_DIR, 'uploads') if SPILL_DIR is not None else None,
+        max_spill_bytes=int(os.environ.get('PICUPG_SPILL_MB', '4096')) * 1024 * 1024,
+    )
+
+@st.cache_resource
+def get_job_queue():
+    """Process-wide filter job queue, scheduled fairly across sessions"""
+    return JobQueue(workers=os.cpu_count() or 4, max_pending=MAX_PENDING_JOBS)
+
+def submit_job(func, *args, **kwargs):
+    """Queue a filter job for this session and return its id"""
+    return get_job_queue().submit(func, *args, owner=st.session_state.session_key, **kwargs)
+
+def job_status(job_id):
+    """The job's state, or 'cancelled' once the queue has dropped its record"""
+    try:
+        return get_job_queue().status(job_id)
+    except KeyError:
+        return 'cancelled'
+
+def cancel_pending_result():
+    """Cancel this session's background full-resolution job, if any"""
+    if st.session_state.pending_result is not None:
+        get_job_queue().cancel(st.session_state.pending_result)
+        get_job_queue().forget(st.session_state.pending_result)
+        st.session_state.pending_result = None
+
+@timing.timed('publish_static')
+def publish_static_file(data, name):
+    """Write bytes under the static directory once and return their URL"""
+    upload_dir = STATIC_DIR / 'uploads'
+    path = upload_dir / name
+    if not path.exists():
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        # Sessions publish from their own threads; each writer gets its own temporary name
+        tmp_path = upload_dir / f"{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path.write_bytes(data)
+        try:
+            tmp_path.replace(path)
+        except FileNotFoundError:
+            # Only if another writer already published the same content
+            if not path.exists():
+                raise
         
-        **Formula:** New_Pixel = 8×Center - (Sum of 8 neighbors)
-        """,
-        'icon': '🔍'
+        # Keep the directory bounded by dropping the least recently used files;
+        # other sessions may delete entries while the directory is scanned
+        published = []
+        for entry in upload_dir.iterdir():
+            if entry.suffix == '.tmp':
+                continue
+            try:
+                published.append((entry.stat().st_mtime, entry))
+            except FileNotFoundError:
+                continue
+        published.sort()
+        for _, old_path in published[:-MAX_PUBLISHED_FILES]:
+            old_path.unlink(missing_ok=True)
+    return f"{STATIC_URL}/uploads/{name}"
+
+def refresh_published(url):
+    """Mark a published file as recently used; False if it has been pruned
+
+    Other sessions prune the shared directory, so a URL kept in session
+    state must be checked before it is rendered again.
+    """
+    try:
+        os.utime(STATIC_DIR / 'uploads' / url.rsplit('/', 1)[-1])
+    except FileNotFoundError:
+        return False
+    return True
+
+def published_upload_data(data, format):
+    """Return (bytes, extension) the browser can display for an upload"""
+    # Serve the uploaded bytes as-is when the browser can display them
+    if format in ('JPEG', 'PNG'):
+        return data, 'jpg' if format == 'JPEG' else 'png'
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(buf, format='PNG')
+    return buf.getvalue(), 'png'
+
+def prepare_upload(uploaded_file):
+    """Decode an upload once and keep everything reruns need in session state"""
+    upload = st.session_state.upload
+    if upload is not None and upload['file_id'] == uploaded_file.file_id:
+        if not get_image_store().touch(st.session_state.session_key):
+            # Idle past the store's TTL: register again so the decoded planes
+            # count against the budget and identical uploads share one entry
+            _, upload['derived'] = get_image_store().acquire(uploaded_file.getvalue(), st.session_state.session_key)
+        if not refresh_published(upload['full_url']):
+            full_data, extension = published_upload_data(uploaded_file.getvalue(), upload['derived'].format)
+            upload['full_url'] = publish_static_file(full_data, f"{upload['digest']}.{extension}")
+        return upload
+    
+    data = uploaded_file.getvalue()
+    
+    # Shared with other sessions that uploaded the same bytes. Only the header
+    # is read here; planes are decoded when first needed, JPEG previews use a
+    # reduced-size decode, and the store drops decoded planes over budget
+    digest, derived = get_image_store().acquire(data, st.session_state.session_key)
+    full_data, extension = published_upload_data(data, derived.format)
+    
+    upload = {
+        'file_id': uploaded_file.file_id,
+        'digest': digest,
+        'derived': derived,
+        'display': derived.thumbnail(max_width=500, max_height=500),
+        'size': derived.size,
+        'full_url': publish_static_file(full_data, f"{digest}.{extension}"),
     }
-}
+    st.session_state.upload = upload
+    return upload
 
-def apply_convolution(image, kernel):
-    """Apply convolution filter to image"""
-    # Convert PIL Image to numpy array
-    img_array = np.array(image)
-    
-    # Convert to RGB if needed
-    if len(img_array.shape) == 2:
-        img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-    elif img_array.shape[2] == 4:
-        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-    
-    # Apply filter to each channel
-    filtered = cv2.filter2D(img_array, -1, kernel)
-    
-    # Clip values to valid range
-    filtered = np.clip(filtered, 0, 255).astype(np.uint8)
-    
-    return Image.fromarray(filtered)
+def load_processed_image(upload):
+    """Fetch the current result from the shared cache, recomputing it if evicted"""
+    width, height = upload['size']
+    return cached_convolution(
+        lambda: upload['derived'].rgb,
+        st.session_state.kernel_used,
+        upload['digest'],
+        get_result_cache(),
+        output=st.session_state.output_mode,
+        tile_rows=TILE_ROWS if width * height > TILED_PIXEL_THRESHOLD else None,
+        workers=CONVOLUTION_WORKERS if width * height > PARALLEL_PIXEL_THRESHOLD else None,
+    )
+
+@timing.timed('prepare_output')
+def prepare_processed_output(encoding, image=None):
+    """Encode the current result once; download and fullscreen share the bytes
 
-def show_processing_animation(image, kernel, filter_name):
+    Sessions keep only the encoded bytes and a display thumbnail. The
+    full-resolution image lives in the shared result cache and is fetched
+    again only when the output settings change.
+    """
+    key = st.session_state.processed_key
+    output = st.session_state.processed_output
+    if output is not None and output['key'] == key and output['encoding'] == encoding:
+        if not refresh_published(output['full_url']):
+            output['full_url'] = publish_static_file(output['data'], f"{image_digest(output['data'])}.{output['extension']}")
+        return output
+    
+    if image is None:
+        image = load_processed_image(st.session_state.upload)
+    data = encode_image(image, **encoding)
+    extension = OUTPUT_FORMATS[encoding['format']]['extension']
+    output = {
+        'key': key,
+        'encoding': encoding,
+        'data': data,
+        'mime': OUTPUT_FORMATS[encoding['format']]['mime'],
+        'extension': extension,
+        'display': resize_image_for_display(image, max_width=500, max_height=500),
+        'full_url': publish_static_file(data, f"{image_digest(data)}.{extension}"),
+    }
+    st.session_state.processed_output = output
+    return output
+
+def show_processing_animation(gray, kernel, filter_name):
     """Show animated mathematical calculation step-by-step"""
-    # Get sample region data
-    img_array = np.array(image)
-    if len(img_array.shape) == 3:
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = img_array
-    
+    # Sample region data comes from the precomputed grayscale plane
     h, w = gray.shape
     x, y = w // 2, h // 2
     region = gray[y-1:y+2, x-1:x+2].astype(float)
@@ -590,65 +788,9 @@ Convolution Kernel:
                 </div>
             </div>
         </div>
-    """.format(image.size[0], image.size[1]), unsafe_allow_html=True)
+    """.format(w, h), unsafe_allow_html=True)
     time.sleep(0.8)
 
-def get_sample_region_calculation(image, kernel, x=None, y=None):
-    """Get a sample calculation showing the convolution process"""
-    img_array = np.array(image)
-    
-    # Convert to grayscale for simpler calculation display
-    if len(img_array.shape) == 3:
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = img_array
-    
-    h, w = gray.shape
-    
-    # Select a region from the middle if not specified
-    if x is None or y is None:
-        x = w // 2
-        y = h // 2
-    
-    # Ensure we're not at the edge
-    if x < 1: x = 1
-    if y < 1: y = 1
-    if x >= w - 1: x = w - 2
-    if y >= h - 1: y = h - 2
-    
-    # Extract 3x3 region
-    region = gray[y-1:y+2, x-1:x+2].astype(float)
-    
-    # Calculate convolution step by step
-    steps = []
-    calculation_parts = []
-    
-    for i in range(3):
-        for j in range(3):
-            pixel_val = region[i, j]
-            kernel_val = kernel[i, j]
-            product = pixel_val * kernel_val
-            steps.append({
-                'position': f"[{i},{j}]",
-                'pixel': pixel_val,
-                'kernel': kernel_val,
-                'product': product
-            })
-            calculation_parts.append(f"{pixel_val:.0f} × {kernel_val:.3f}")
-    
-    total = np.sum(region * kernel)
-    final_value = np.clip(total, 0, 255)
-    
-    return {
-        'region': region,
-        'kernel': kernel,
-        'steps': steps,
-        'calculation_parts': calculation_parts,
-        'total': total,
-        'final_value': final_value,
-        'position': (x, y)
-    }
-
 def format_kernel_display(kernel, name):
     """Format kernel matrix for display"""
     kernel_str = f"<div class='kernel-display'>"
@@ -668,33 +810,300 @@ def format_kernel_display(kernel, name):
     kernel_str += "</pre></div>"
     return kernel_str
 
-def resize_image_for_display(image, max_width=500, max_height=500):
-    """Resize image to fixed display size"""
-    width, height = image.size
-    
-    # Calculate aspect ratio
-    aspect = width / height
-    
-    # Resize to fixed dimensions while maintaining aspect ratio
-    if aspect > 1:
-        # Wider image
-        new_width = min(width, max_width)
-        new_height = int(new_width / aspect)
+@st.fragment(run_every=0.25)
+def poll_pending_result(output_encoding):
+    """Swap in the full-resolution result once its background job finishes"""
+    job_id = st.session_state.pending_result
+    if job_id is None:
+        return
+    if job_status(job_id) in ('queued', 'running'):
+        st.caption("⏳ Rendering full resolution for download and fullscreen...")
+        return
+    
+    error = None
+    try:
+        image = get_job_queue().result(job_id)
+    except (KeyError, CancelledJob):
+        # Dropped by the queue before this session collected it
+        error = "the full-resolution result expired before it was collected, please try again"
+    except Exception as exc:
+        error = str(exc) or type(exc).__name__
+    finally:
+        get_job_queue().forget(job_id)
+        st.session_state.pending_result = None
+    st.session_state.preview_image = None
+    if error is not None:
+        st.session_state.filter_error = error
+        st.rerun()
+    st.session_state.processed_key = result_key(
+        st.session_state.upload['digest'], st.session_state.kernel_used, st.session_state.output_mode
+    )
+    prepare_processed_output(output_encoding, image)
+    get_image_store().touch(st.session_state.session_key)
+    st.rerun()
+
+def get_filter(filter_key):
+    """Built-in KERNELS entry or one of this session's custom kernels"""
+    if filter_key in KERNELS:
+        return KERNELS[filter_key]
+    return st.session_state.custom_kernels[filter_key]
+
+def register_custom_kernel(matrix, name, normalize):
+    """Compile a custom kernel once and add it to this session's filters; return its key"""
+    if normalize:
+        matrix = normalize_kernel(matrix)
+    compiled = compile_kernel(matrix)
+    rows, cols = compiled['shape']
+    name = name.strip() or f"Custom {rows}×{cols}"
+    structure = "separable into a row and a column pass" if compiled['separable'] else f"rank {compiled['rank']}"
+    filter_key = f"custom_{compiled['digest'][:12]}"
+    st.session_state.custom_kernels[filter_key] = {
+        # The registry's own matrix, so later lookups skip re-analysis
+        'matrix': compiled['matrix'],
+        'name': name,
+        'explanation': f"""
+        **How it works:** A custom {rows}×{cols} kernel. Each output pixel is the weighted sum
+        of the {rows * cols} pixels under the kernel, using the weights shown in the matrix.
+        
+        **Structure:** The weights sum to {compiled['sum']:.3f} and the kernel is {structure},
+        so the engine runs it with the **{compiled['backend'].replace('_', ' ')}** backend.
+        """,
+        'icon': '🧪',
+        'compiled': compiled,
+    }
+    return filter_key
+
+def start_batch(files, filter_keys, output_mode, output_encoding):
+    """Start filtering a multi-file upload; results collect in a ZIP on disk"""
+    work_dir = Path(tempfile.mkdtemp(prefix='picupg-batch-'))
+    st.session_state.batch = {
+        'todo': deque((uploaded.getvalue(), uploaded.name) for uploaded in files),
+        'jobs': {},
+        'kernels': {key: get_filter(key)['matrix'] for key in filter_keys},
+        'output': output_mode,
+        'encoding': output_encoding,
+        'done': 0,
+        'total': len(files),
+        'failed': [],
+        'dir': work_dir,
+        'zip_path': work_dir / 'filtered_images.zip',
+        'archive': None,
+    }
+    submit_batch_jobs(st.session_state.batch)
+
+def submit_batch_jobs(batch):
+    """Queue the batch's next images, keeping BATCH_JOBS_IN_FLIGHT at most"""
+    while batch['todo'] and len(batch['jobs']) < BATCH_JOBS_IN_FLIGHT:
+        data, name = batch['todo'][0]
+        try:
+            job_id = submit_job(
+                filter_upload, data, name, batch['kernels'], get_result_cache(),
+                output=batch['output'], encoding=batch['encoding'],
+            )
+        except QueueFull:
+            # Other sessions' work comes first; the poll retries on its next tick
+            return
+        batch['todo'].popleft()
+        batch['jobs'][job_id] = name
+
+@st.fragment(run_every=0.25)
+def poll_batch():
+    """Add finished batch images to the ZIP and show progress by completed jobs"""
+    batch = st.session_state.batch
+    if batch is None or batch['archive'] is not None:
+        return
+    
+    queue = get_job_queue()
+    entries = []
+    for job_id, name in list(batch['jobs'].items()):
+        if job_status(job_id) in ('queued', 'running'):
+            continue
+        try:
+            entries.extend(queue.result(job_id))
+        except KeyError:
+            batch['failed'].append(f"{name}: result expired before it was collected")
+        except Exception as exc:
+            # Any failure, expected or not, only costs this one image
+            batch['failed'].append(f"{name}: {exc}")
+        finally:
+            queue.forget(job_id)
+            del batch['jobs'][job_id]
+            batch['done'] += 1
+    if entries:
+        append_to_zip(batch['zip_path'], entries)
+    submit_batch_jobs(batch)
+    
+    if batch['done'] < batch['total']:
+        st.progress(batch['done'] / batch['total'], text=f"📦 Processed {batch['done']} of {batch['total']} images")
+        return
+    
+    if batch['zip_path'].exists():
+        batch['archive'] = batch['zip_path'].read_bytes()
     else:
-        # Taller image
-        new_height = min(height, max_height)
-        new_width = int(new_height * aspect)
-    
-    # Ensure it doesn't exceed max dimensions
-    if new_width > max_width:
-        new_width = max_width
-        new_height = int(new_width / aspect)
-    if new_height > max_height:
-        new_height = max_height
-        new_width = int(new_height * aspect)
-    
-    image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-    return image
+        batch['archive'] = b''
+    shutil.rmtree(batch['dir'], ignore_errors=True)
+    st.rerun()
+
+def cancel_batch():
+    """Drop this session's batch, cancelling images that have not started"""
+    batch = st.session_state.batch
+    if batch is None:
+        return
+    for job_id in batch['jobs']:
+        get_job_queue().cancel(job_id)
+        get_job_queue().forget(job_id)
+    shutil.rmtree(batch['dir'], ignore_errors=True)
+    st.session_state.batch = None
+
+def start_clip_job(clip_file, filter_key, output_mode):
+    """Queue a video/GIF filter job whose frames stream through the engine"""
+    work_dir = Path(tempfile.mkdtemp(prefix='picupg-clip-'))
+    src_path = work_dir / f"source{Path(clip_file.name).suffix.lower()}"
+    src_path.write_bytes(clip_file.getvalue())
+    # Long GIFs come back as MP4, whose writer streams instead of keeping every frame
+    try:
+        suffix = output_suffix(src_path)
+    except (OSError, ValueError):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    dst_path = work_dir / f"{Path(clip_file.name).stem}_{filter_key}{suffix}"
+    
+    # Written by the job's thread, read by poll_clip_job
+    progress = {'done': 0, 'total': 0}
+    
+    def report(done, total):
+        progress['done'] = done
+        progress['total'] = total
+    
+    try:
+        job_id = submit_job(
+            convolve_clip, src_path, dst_path, get_filter(filter_key)['matrix'],
+            workers=CONVOLUTION_WORKERS, output=output_mode, progress=report,
+        )
+    except QueueFull:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    st.session_state.clip_result = None
+    st.session_state.clip_job = {'id': job_id, 'progress': progress, 'dir': work_dir, 'path': dst_path}
+
+@st.fragment(run_every=0.25)
+def poll_clip_job():
+    """Show frame progress of this session's clip job and collect its output"""
+    clip_job = st.session_state.clip_job
+    if clip_job is None:
+        return
+    if job_status(clip_job['id']) in ('queued', 'running'):
+        done, total = clip_job['progress']['done'], clip_job['progress']['total']
+        label = f"🎞️ Filtered {done} of {total} frames" if total else f"🎞️ Filtered {done} frames"
+        st.progress(min(done / total, 1.0) if total else 0.0, text=label)
+        return
+    
+    try:
+        stats = get_job_queue().result(clip_job['id'])
+        st.session_state.clip_result = {
+            'name': clip_job['path'].name,
+            'data': clip_job['path'].read_bytes(),
+            'stats': stats,
+        }
+    except KeyError:
+        st.session_state.clip_result = {'error': "result expired before it was collected"}
+    except Exception as exc:
+        st.session_state.clip_result = {'error': str(exc)}
+    finally:
+        get_job_queue().forget(clip_job['id'])
+        shutil.rmtree(clip_job['dir'], ignore_errors=True)
+        st.session_state.clip_job = None
+    st.rerun()
+
+@st.fragment
+def render_calculation_panel(gray, kernel, output_mode, digest):
+    """Interactive pixel probe; moving it reruns only this panel"""
+    h, w = gray.shape
+    rows, cols = kernel.shape
+    
+    # Probe position in full-resolution pixels, defaulting to the centre
+    probe_cols = st.columns(2)
+    with probe_cols[0]:
+        x = st.slider("📍 Probe x", 0, w - 1, w // 2, key=f"probe_x_{digest}")
+    with probe_cols[1]:
+        y = st.slider("📍 Probe y", 0, h - 1, h // 2, key=f"probe_y_{digest}")
+    
+    calc_data = get_sample_region_calculation(gray, kernel, x, y)
+    
+    st.markdown("""
+        <div class='calculation-box'>
+            <div class='calculation-header'>
+                📍 Sample Calculation at Position ({}, {})
+            </div>
+        </div>
+    """.format(calc_data['position'][0], calc_data['position'][1]), unsafe_allow_html=True)
+    
+    col_calc1, col_calc2 = st.columns(2)
+    
+    with col_calc1:
+        st.markdown(f"**Step 1: Input Region ({rows}×{cols} pixels)**")
+        region_str = "<div class='matrix-display'><pre style='margin:0; color: #fff;'>"
+        for row in calc_data['region']:
+            region_str += "[ "
+            for val in row:
+                region_str += f"{val:6.0f} "
+            region_str += "]\n"
+        region_str += "</pre></div>"
+        st.markdown(region_str, unsafe_allow_html=True)
+        
+        st.markdown("**Step 2: Convolution Kernel**")
+        kernel_str = "<div class='matrix-display'><pre style='margin:0; color: #fff;'>"
+        for row in calc_data['kernel']:
+            kernel_str += "[ "
+            for val in row:
+                kernel_str += f"{val:6.3f} "
+            kernel_str += "]\n"
+        kernel_str += "</pre></div>"
+        st.markdown(kernel_str, unsafe_allow_html=True)
+    
+    with col_calc2:
+        st.markdown("**Step 3: Element-wise Multiplication**")
+        st.markdown("<div class='step-container'>", unsafe_allow_html=True)
+        
+        # Show first few calculations
+        for i, step in enumerate(calc_data['steps'][:9]):
+            calc_line = f"<div class='calculation-step'>"
+            calc_line += f"Position {step['position']}: {step['pixel']:.0f} × {step['kernel']:.3f} = {step['product']:.2f}"
+            calc_line += "</div>"
+            st.markdown(calc_line, unsafe_allow_html=True)
+        
+        st.markdown("</div>", unsafe_allow_html=True)
+        
+        st.markdown("**Step 4: Sum All Products**")
+        sum_text = " + ".join([f"{step['product']:.2f}" for step in calc_data['steps'][:3]])
+        sum_text += " + ... "
+        st.markdown(f"<div class='step-container' style='color: #333;'><code>{sum_text}</code></div>", unsafe_allow_html=True)
+    
+    # Final result, following the output mode the image was filtered with
+    if output_mode == 'abs':
+        final_text = f"Absolute value, clipped to [0, 255] → <strong>{min(abs(calc_data['total']), 255):.0f}</strong>"
+    elif output_mode == 'minmax':
+        final_text = "Rescaled with the image's min and max responses to [0, 255]"
+    else:
+        final_text = f"Clipped to [0, 255] → <strong>{calc_data['final_value']:.0f}</strong>"
+    st.markdown(f"""
+        <div class='final-result'>
+            🎯 Final Result: {calc_data['total']:.2f} → {final_text}
+        </div>
+    """, unsafe_allow_html=True)
+    
+    st.markdown(f"""
+        <div style='background: #fff3cd; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #ffc107;'>
+            <strong>💡 What Just Happened?</strong><br>
+            <span style='color: #333;'>
+            1. We selected a {rows}×{cols} region from the image<br>
+            2. Multiplied each pixel by the corresponding kernel value<br>
+            3. Summed all {rows * cols} products together<br>
+            4. This sum becomes the new pixel value at the center position!<br>
+            5. This process repeats for EVERY pixel in the image!
+            </span>
+        </div>
+    """, unsafe_allow_html=True)
 
 # Header
 st.markdown("""
@@ -740,6 +1149,41 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
     
+    st.markdown("---")
+    st.markdown("### ⚙️ Settings")
+    fast_mode = st.toggle(
+        "⚡ Fast mode",
+        value=False,
+        help="Skip the step-by-step walkthrough and apply filters immediately"
+    )
+    
+    output_mode = st.selectbox(
+        "Output mode",
+        list(OUTPUT_MODES),
+        format_func=OUTPUT_MODES.get,
+        help="How filter responses outside [0, 255] become pixels. "
+             "Absolute value keeps negative edge responses."
+    )
+    
+    output_format = st.selectbox(
+        "Output format",
+        list(OUTPUT_FORMATS),
+        help="Format used for both the fullscreen view and the download"
+    )
+    if output_format == 'PNG':
+        output_encoding = {
+            'format': 'PNG',
+            'compress_level': st.slider(
+                "PNG compression level", 0, 9, 1,
+                help="Lower levels encode much faster but produce larger files"
+            ),
+        }
+    else:
+        output_encoding = {
+            'format': output_format,
+            'quality': st.slider("Quality", 50, 100, 90),
+        }
+    
     st.markdown("---")
     st.markdown("### ℹ️ Tips")
     st.info("• Use images < 5MB for best performance\n• Try different filters to see varied effects\n• Click Reset to start fresh")
@@ -756,14 +1200,11 @@ with col1:
     )
     
     if uploaded_file is not None:
-        # Load and display original image
-        original_image = Image.open(uploaded_file)
-        display_original = resize_image_for_display(original_image, max_width=500, max_height=500)
-        
-        # Convert original image to base64 for fullscreen
-        buf_original = io.BytesIO()
-        original_image.save(buf_original, format='PNG')
-        orig_img_base64 = base64.b64encode(buf_original.getvalue()).decode()
+        # Decoding, thumbnail and fullscreen URL are computed once per upload
+        with timing.span('prepare_upload'):
+            upload = prepare_upload(uploaded_file)
+        derived = upload['derived']
+        display_original = upload['display']
         
         st.markdown("<div class='image-label'>📸 Original Image (Click to Enlarge)</div>", unsafe_allow_html=True)
         
@@ -771,7 +1212,7 @@ with col1:
         st.markdown(f"""
             <div id="fullscreenModalOrig" class="fullscreen-modal">
                 <span class="close-fullscreen" onclick="closeFullscreenOrig()">&times;</span>
-                <img class="fullscreen-content" src="data:image/png;base64,{orig_img_base64}">
+                <img class="fullscreen-content" src="{upload['full_url']}" loading="lazy">
             </div>
             
             <div style='cursor: pointer;' onclick='openFullscreenOrig()' title='Click to view fullscreen'>
@@ -807,7 +1248,7 @@ with col1:
         
         st.markdown(f"""
         <div class='metric-card' style='margin-top: 0.5rem;'>
-            <strong>Dimensions:</strong> {original_image.size[0]} × {original_image.size[1]} pixels
+            <strong>Dimensions:</strong> {upload['size'][0]} × {upload['size'][1]} pixels
         </div>
         """, unsafe_allow_html=True)
 
@@ -836,6 +1277,72 @@ with col2:
                 st.session_state.current_filter = 'edge'
                 st.rerun()
         
+        with st.expander("🧪 Custom Kernel"):
+            preset = st.selectbox("Start from", list(CUSTOM_KERNEL_PRESETS), key="kernel_preset")
+            kernel_text = st.text_area(
+                "Kernel matrix",
+                value=CUSTOM_KERNEL_PRESETS[preset],
+                height=150,
+                help="One row per line, values separated by spaces or commas. Fractions such as 1/9 are allowed.",
+                key=f"kernel_text_{preset}"
+            )
+            kernel_file = st.file_uploader(
+                "...or upload a kernel (JSON or .npy)",
+                type=['json', 'npy'],
+                help='JSON may be a list of rows or {"name": ..., "matrix": [[...]]}',
+                key="kernel_file"
+            )
+            kernel_name = st.text_input("Name", placeholder="e.g. My Gaussian", key="kernel_name")
+            normalize = st.checkbox(
+                "Normalize weights to sum to 1",
+                value=True,
+                help="Keeps overall brightness for blur-like kernels; kernels summing to 0 are left as they are"
+            )
+            
+            if st.button("🧪 Apply Custom Kernel", key="custom_btn"):
+                try:
+                    if kernel_file is not None:
+                        matrix, file_name = load_kernel_file(kernel_file.getvalue(), kernel_file.name)
+                        kernel_name = kernel_name or file_name or ''
+                    else:
+                        matrix = parse_kernel_text(kernel_text)
+                        if not kernel_name and kernel_text == CUSTOM_KERNEL_PRESETS[preset]:
+                            kernel_name = preset
+                    filter_key = register_custom_kernel(matrix, kernel_name, normalize)
+                except ValueError as exc:
+                    st.error(f"Invalid kernel: {exc}")
+                else:
+                    st.session_state.processing = True
+                    st.session_state.current_filter = filter_key
+                    st.rerun()
+        
+        if st.button("🔀 Compare All Filters", key="compare_btn"):
+            # All kernels share one read and RGB conversion per strip
+            width, height = upload['size']
+            filter_keys = list(KERNELS)
+            try:
+                job_id = submit_job(
+                    cached_convolutions,
+                    lambda: derived.rgb,
+                    [KERNELS[key]['matrix'] for key in filter_keys],
+                    upload['digest'],
+                    get_result_cache(),
+                    output=output_mode,
+                    workers=CONVOLUTION_WORKERS if width * height > PARALLEL_PIXEL_THRESHOLD else None,
+                )
+            except QueueFull:
+                st.warning("⏳ The server is busy with other filter requests. Please try again in a moment.")
+            else:
+                try:
+                    with st.spinner("Comparing filters..."), timing.span('job_wait'):
+                        results = get_job_queue().result(job_id)
+                finally:
+                    get_job_queue().forget(job_id)
+                st.session_state.comparison = [
+                    (key, resize_image_for_display(result, max_width=300, max_height=300))
+                    for key, result in zip(filter_keys, results)
+                ]
+        
         # Create a placeholder for animation/image
         result_placeholder = st.empty()
         
@@ -843,44 +1350,95 @@ with col2:
         if st.session_state.processing and st.session_state.current_filter:
             # Show animation in place of everything
             filter_key = st.session_state.current_filter
-            with result_placeholder.container():
-                show_processing_animation(original_image, KERNELS[filter_key]['matrix'], KERNELS[filter_key]['name'])
+            filter_info = get_filter(filter_key)
+            # Decoded at full resolution only if the result isn't cached yet
+            convolution_args = (
+                lambda: derived.rgb,
+                filter_info['matrix'],
+                upload['digest'],
+                get_result_cache(),
+            )
+            width, height = upload['size']
+            convolution_options = {
+                'output': output_mode,
+                'tile_rows': TILE_ROWS if width * height > TILED_PIXEL_THRESHOLD else None,
+                'workers': CONVOLUTION_WORKERS if width * height > PARALLEL_PIXEL_THRESHOLD else None,
+            }
+            
+            cancel_pending_result()
+            st.session_state.filter_error = None
             
-            # After animation, process the image
-            st.session_state.processed_image = apply_convolution(original_image, KERNELS[filter_key]['matrix'])
-            st.session_state.kernel_used = KERNELS[filter_key]['matrix']
-            st.session_state.filter_name = KERNELS[filter_key]['name']
-            st.session_state.explanation = KERNELS[filter_key]['explanation']
+            try:
+                job_id = submit_job(cached_convolution, *convolution_args, **convolution_options)
+            except QueueFull:
+                st.session_state.processing = False
+                st.session_state.current_filter = None
+                st.warning("⏳ The server is busy with other filter requests. Please try again in a moment.")
+                st.stop()
+            
+            if fast_mode and width * height > PROGRESSIVE_PIXEL_THRESHOLD:
+                # Filter the display-size proxy now and leave the full-resolution
+                # job queued; poll_pending_result swaps it in when done
+                st.session_state.preview_image = apply_convolution(
+                    upload['display'], filter_info['matrix'], output=output_mode
+                )
+                st.session_state.pending_result = job_id
+                st.session_state.processed_key = None
+                st.session_state.processed_output = None
+            else:
+                # A click during the walkthrough reruns the script from here; the
+                # finally keeps the abandoned job's result from lingering in the queue
+                try:
+                    if not fast_mode and filter_info['matrix'].shape == (3, 3):
+                        # The job runs on the worker pool while the walkthrough plays
+                        with result_placeholder.container(), timing.span('animation'):
+                            show_processing_animation(derived.gray, filter_info['matrix'], filter_info['name'])
+                    with timing.span('job_wait'):
+                        image = get_job_queue().result(job_id)
+                finally:
+                    get_job_queue().forget(job_id)
+                st.session_state.processed_key = result_key(upload['digest'], filter_info['matrix'], output_mode)
+                prepare_processed_output(output_encoding, image)
+                get_image_store().touch(st.session_state.session_key)
+            st.session_state.output_mode = output_mode
+            st.session_state.kernel_used = filter_info['matrix']
+            st.session_state.filter_name = filter_info['name']
+            st.session_state.explanation = filter_info['explanation']
             st.session_state.processing = False
             st.session_state.current_filter = None
             st.rerun()
         
-        elif st.session_state.processed_image is not None:
+        elif st.session_state.pending_result is not None:
+            # Show the instant preview until the full-resolution result is ready
+            with result_placeholder.container():
+                st.markdown(f"""
+                    <div class='image-label'>✨ {st.session_state.filter_name} (Preview)</div>
+                """, unsafe_allow_html=True)
+                st.image(st.session_state.preview_image)
+                poll_pending_result(output_encoding)
+        
+        elif st.session_state.processed_key is not None:
             # Display processed image in the same box after animation is done
             with result_placeholder.container():
-                display_processed = resize_image_for_display(st.session_state.processed_image, max_width=500, max_height=500)
+                # Re-encodes only if the output settings changed since the last rerun
+                output = prepare_processed_output(output_encoding)
                 
                 st.markdown(f"""
                     <div class='image-label'>✨ {st.session_state.filter_name} (Click to Enlarge)</div>
                 """, unsafe_allow_html=True)
                 
-                # Convert image to base64 for fullscreen modal
-                buf_fullscreen = io.BytesIO()
-                st.session_state.processed_image.save(buf_fullscreen, format='PNG')
-                img_base64 = base64.b64encode(buf_fullscreen.getvalue()).decode()
-                
                 # Display image with fullscreen capability
                 st.markdown(f"""
                     <!-- Fullscreen Modal -->
                     <div id="fullscreenModal" class="fullscreen-modal">
                         <span class="close-fullscreen" onclick="closeFullscreen()">&times;</span>
-                        <img class="fullscreen-content" id="fullscreenImg" src="data:image/png;base64,{img_base64}">
+                        <img class="fullscreen-content" id="fullscreenImg" src="{output['full_url']}" loading="lazy">
                     </div>
                     
                     <div style='cursor: pointer;' onclick='openFullscreen()' title='Click to view fullscreen'>
                 """, unsafe_allow_html=True)
                 
-                st.image(display_processed)
+                st.image(output['display'])
                 
                 st.markdown("""
                     </div>
@@ -908,92 +1466,30 @@ with col2:
                     </script>
                 """, unsafe_allow_html=True)
                 
-                # Download button
-                buf = io.BytesIO()
-                st.session_state.processed_image.save(buf, format='PNG')
-                byte_im = buf.getvalue()
-                
+                # Download button serves the same encoded bytes as the fullscreen view
                 st.download_button(
                     label="💾 Download Processed Image",
-                    data=byte_im,
-                    file_name=f"processed_{st.session_state.filter_name.lower().replace(' ', '_')}.png",
-                    mime="image/png"
+                    data=output['data'],
+                    file_name=f"processed_{st.session_state.filter_name.lower().replace(' ', '_')}.{output['extension']}",
+                    mime=output['mime']
                 )
             
             # Show real-time calculation below (outside placeholder)
             st.markdown("---")
             st.markdown("### 🧮 Real-Time Convolution Calculation")
-            
-            calc_data = get_sample_region_calculation(original_image, st.session_state.kernel_used)
-            
-            st.markdown("""
-                <div class='calculation-box'>
-                    <div class='calculation-header'>
-                        📍 Sample Calculation at Position ({}, {})
-                    </div>
-                </div>
-            """.format(calc_data['position'][0], calc_data['position'][1]), unsafe_allow_html=True)
-            
-            col_calc1, col_calc2 = st.columns(2)
-            
-            with col_calc1:
-                st.markdown("**Step 1: Input Region (3×3 pixels)**")
-                region_str = "<div class='matrix-display'><pre style='margin:0; color: #fff;'>"
-                for row in calc_data['region']:
-                    region_str += "[ "
-                    for val in row:
-                        region_str += f"{val:6.0f} "
-                    region_str += "]\n"
-                region_str += "</pre></div>"
-                st.markdown(region_str, unsafe_allow_html=True)
-                
-                st.markdown("**Step 2: Convolution Kernel**")
-                kernel_str = "<div class='matrix-display'><pre style='margin:0; color: #fff;'>"
-                for row in calc_data['kernel']:
-                    kernel_str += "[ "
-                    for val in row:
-                        kernel_str += f"{val:6.3f} "
-                    kernel_str += "]\n"
-                kernel_str += "</pre></div>"
-                st.markdown(kernel_str, unsafe_allow_html=True)
-            
-            with col_calc2:
-                st.markdown("**Step 3: Element-wise Multiplication**")
-                st.markdown("<div class='step-container'>", unsafe_allow_html=True)
-                
-                # Show first few calculations
-                for i, step in enumerate(calc_data['steps'][:9]):
-                    calc_line = f"<div class='calculation-step'>"
-                    calc_line += f"Position {step['position']}: {step['pixel']:.0f} × {step['kernel']:.3f} = {step['product']:.2f}"
-                    calc_line += "</div>"
-                    st.markdown(calc_line, unsafe_allow_html=True)
-                
-                st.markdown("</div>", unsafe_allow_html=True)
-                
-                st.markdown("**Step 4: Sum All Products**")
-                sum_text = " + ".join([f"{step['product']:.2f}" for step in calc_data['steps'][:3]])
-                sum_text += " + ... "
-                st.markdown(f"<div class='step-container' style='color: #333;'><code>{sum_text}</code></div>", unsafe_allow_html=True)
-            
-            # Final result
-            st.markdown(f"""
-                <div class='final-result'>
-                    🎯 Final Result: {calc_data['total']:.2f} → Clipped to [0, 255] → <strong>{calc_data['final_value']:.0f}</strong>
-                </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown("""
-                <div style='background: #fff3cd; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #ffc107;'>
-                    <strong>💡 What Just Happened?</strong><br>
-                    <span style='color: #333;'>
-                    1. We selected a 3×3 region from the image<br>
-                    2. Multiplied each pixel by the corresponding kernel value<br>
-                    3. Summed all 9 products together<br>
-                    4. This sum becomes the new pixel value at the center position!<br>
-                    5. This process repeats for EVERY pixel in the image!
-                    </span>
-                </div>
-            """, unsafe_allow_html=True)
+            render_calculation_panel(derived.gray, st.session_state.kernel_used, st.session_state.output_mode, upload['digest'])
+        
+        elif st.session_state.filter_error is not None:
+            with result_placeholder.container():
+                st.error(f"Could not apply the filter: {st.session_state.filter_error}")
+        
+        if st.session_state.comparison is not None:
+            st.markdown("---")
+            st.markdown("### 🔀 All Filters Compared")
+            compare_cols = st.columns(len(st.session_state.comparison))
+            for compare_col, (key, thumbnail) in zip(compare_cols, st.session_state.comparison):
+                with compare_col:
+                    st.image(thumbnail, caption=f"{KERNELS[key]['icon']} {KERNELS[key]['name']}")
     else:
         st.markdown("""
         <div class='info-card' style='margin-top: 3rem; background: #ffffff; border: 1px solid #e0e0e0;'>
@@ -1006,12 +1502,20 @@ with col2:
 if uploaded_file is not None:
     st.markdown("---")
     if st.button("🔄 Reset & Start Over", key="reset_btn"):
-        st.session_state.processed_image = None
+        st.session_state.processed_key = None
+        st.session_state.processed_output = None
+        st.session_state.comparison = None
+        st.session_state.output_mode = 'clip'
         st.session_state.kernel_used = None
         st.session_state.filter_name = None
         st.session_state.explanation = None
         st.session_state.processing = False
         st.session_state.current_filter = None
+        st.session_state.upload = None
+        st.session_state.preview_image = None
+        st.session_state.filter_error = None
+        cancel_pending_result()
+        get_image_store().release(st.session_state.session_key)
         st.rerun()
 
 # Display kernel and explanation
@@ -1053,6 +1557,107 @@ if uploaded_file is None:
             </div>
             """, unsafe_allow_html=True)
 
+# Batch processing
+st.markdown("---")
+with st.expander("📦 Batch Process Images"):
+    batch_files = st.file_uploader(
+        "📤 Upload several images (JPG, PNG)",
+        type=['jpg', 'jpeg', 'png'],
+        accept_multiple_files=True,
+        help="Every image is filtered in the background and collected into one ZIP download",
+        key="batch_uploader"
+    )
+    batch_filters = st.multiselect(
+        "Filters to apply",
+        list(KERNELS) + list(st.session_state.custom_kernels),
+        default=list(KERNELS),
+        format_func=lambda key: f"{get_filter(key)['icon']} {get_filter(key)['name']}",
+        key="batch_filters"
+    )
+    
+    batch = st.session_state.batch
+    batch_running = batch is not None and batch['archive'] is None
+    col_start, col_cancel = st.columns([1, 1])
+    with col_start:
+        if st.button(
+            "▶️ Process All",
+            key="batch_btn",
+            disabled=not batch_files or not batch_filters or batch_running
+        ):
+            cancel_batch()
+            start_batch(batch_files, batch_filters, output_mode, output_encoding)
+            st.rerun()
+    with col_cancel:
+        if st.button("✖️ Clear Batch", key="batch_clear_btn", disabled=batch is None):
+            cancel_batch()
+            st.rerun()
+    
+    if batch_running:
+        # The poller reruns on a timer, so only start it while there is work to watch
+        poll_batch()
+    
+    batch = st.session_state.batch
+    if batch is not None and batch['archive'] is not None:
+        succeeded = batch['total'] - len(batch['failed'])
+        st.caption(f"✅ Filtered {succeeded} of {batch['total']} images")
+        for failure in batch['failed']:
+            st.error(f"Could not filter {failure}")
+        if batch['archive']:
+            st.download_button(
+                label="⬇️ Download ZIP",
+                data=batch['archive'],
+                file_name="filtered_images.zip",
+                mime="application/zip",
+                key="batch_download"
+            )
+
+# Video and animated GIF filtering
+with st.expander("🎞️ Filter a Video or Animated GIF"):
+    clip_types = sorted(extension.lstrip('.') for extension in VIDEO_EXTENSIONS | ANIMATION_EXTENSIONS)
+    clip_file = st.file_uploader(
+        "📤 Upload a clip (MP4, MOV, AVI, GIF...)",
+        type=clip_types,
+        help="Frames are decoded, filtered and re-encoded as a stream, so long clips need no extra memory",
+        key="clip_uploader"
+    )
+    
+    if clip_file is not None:
+        clip_filter = st.selectbox(
+            "Filter",
+            list(KERNELS) + list(st.session_state.custom_kernels),
+            format_func=lambda key: f"{get_filter(key)['icon']} {get_filter(key)['name']}",
+            key="clip_filter"
+        )
+        if st.button("▶️ Filter Clip", key="clip_btn", disabled=st.session_state.clip_job is not None):
+            try:
+                start_clip_job(clip_file, clip_filter, output_mode)
+            except QueueFull:
+                st.warning("⏳ The server is busy with other filter requests. Please try again in a moment.")
+            except (OSError, ValueError) as exc:
+                st.error(f"Could not filter this clip: {exc}")
+    
+    if st.session_state.clip_job is not None:
+        poll_clip_job()
+    
+    clip_result = st.session_state.clip_result
+    if clip_result is not None and 'error' in clip_result:
+        st.error(f"Could not filter this clip: {clip_result['error']}")
+    elif clip_result is not None:
+        stats = clip_result['stats']
+        st.caption(
+            f"✅ {stats['frames']} frames at {stats['width']} × {stats['height']} "
+            f"in {stats['seconds']:.1f}s ({stats['fps']:.1f} fps)"
+        )
+        if clip_result['name'].endswith('.gif'):
+            st.image(clip_result['data'])
+        st.download_button(
+            label="⬇️ Download Filtered Clip",
+            data=clip_result['data'],
+            file_name=clip_result['name'],
+            mime='image/gif' if clip_result['name'].endswith('.gif') else 'video/mp4',
+            key="clip_download"
+        )
+
 # Footer
 st.markdown("""
     <div class='footer'>
@@ -1062,3 +1667,24 @@ st.markdown("""
         </p>
     </div>
 """, unsafe_allow_html=True)
+
+if SHOW_TIMINGS:
+    recorder = st.session_state.timing_recorder
+    with st.sidebar.expander("⏱️ Stage Timings", expanded=True):
+        rows = recorder.rows()
+        if rows:
+            st.dataframe(
+                [
+                    {'stage': '· ' * row['depth'] + row['stage'], 'ms': row['ms'], 'thread': row['thread']}
+                    for row in rows
+                ],
+                hide_index=True,
+            )
+        else:
+            st.caption("No timed stages ran in this rerun.")
+    # This rerun ran to the end, so the next one starts a fresh table
+    st.session_state.timing_recorder = None
+    timing.activate(None)
+
+if METRICS_FILE:
+    timing.write_prometheus(METRICS_FILE)
@@ -0,0 +1,61 @@
+"""Measure bytes allocated per filter call with tracemalloc
+
+Run from the repository root::
+
+    python -m benchmarks.alloc
+    python -m benchmarks.alloc --size 2000x1500 --calls 5
+
+NumPy (and OpenCV's NumPy-backed outputs) report their buffers to
+tracemalloc, so the numbers cover the pixel buffers the pipeline creates.
+The first call of each case warms plan caches and scratch buffers and is
+not counted; the table shows the mean peak of the remaining calls, in MB
+and relative to the size of the RGB input. Pillow's own pixel storage
+(the returned image) is not visible to tracemalloc.
+"""
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from engine import KERNELS, apply_convolution
+from engine.output import OUTPUT_MODES
+
+
+def measure(func, calls):
+    """Return the mean peak bytes allocated by func over calls, after one warm-up"""
+    func()
+    peaks = []
+    for _ in range(calls):
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+    return sum(peaks) / calls
+
+
+def build_parser():
+    """Build the argument parser for the allocation benchmark"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.alloc', description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='1200x800', help='Image size as WIDTHxHEIGHT (default: 1200x800)')
+    parser.add_argument('--calls', type=int, default=3, help='Measured calls per case (default: 3)')
+    return parser
+
+
+def main(argv=None):
+    """Print the allocation table for every built-in filter and output mode"""
+    args = build_parser().parse_args(argv)
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    rgb = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    megabyte = 1024 * 1024
+
+    print(f"{width}x{height} RGB input: {rgb.nbytes / megabyte:.1f} MB")
+    print(f"{'filter':<10}{'output':<8}{'peak MB':>10}{'peak/input':>12}")
+    for name, spec in KERNELS.items():
+        for output in OUTPUT_MODES:
+            peak = measure(lambda: apply_convolution(rgb, spec['matrix'], output=output), args.calls)
+            print(f"{name:<10}{output:<8}{peak / megabyte:>10.1f}{peak / rgb.nbytes:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
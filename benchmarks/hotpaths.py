@@ -0,0 +1,261 @@
+"""Benchmark the convolution and rendering hot paths on synthetic images
+
+Run from the repository root::
+
+    python -m benchmarks.hotpaths
+    python -m benchmarks.hotpaths --sizes 0.3,2 --modes RGB --repeat 10
+    python -m benchmarks.hotpaths --compare benchmarks/results/old.json benchmarks/results/new.json
+
+Every stage the app runs per click or rerun is timed on deterministic
+synthetic images at each size (in megapixels) and mode. For each stage it
+reports latency percentiles, throughput in megapixels per second and peak
+RSS. Results are written as JSON tagged with the git commit, so two runs
+can be compared with ``--compare``.
+
+Peak RSS is per stage on Linux, where the high-water mark can be reset
+through /proc/self/clear_refs; elsewhere it is the process-wide maximum so
+far.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+import PIL
+from PIL import Image
+
+from engine import KERNELS, apply_convolution, encode_image, get_sample_region_calculation, resize_image_for_display
+
+DEFAULT_SIZES = (0.3, 2, 12, 50)
+DEFAULT_MODES = ('L', 'RGB', 'RGBA')
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def synthetic_image(megapixels, mode, seed=0):
+    """Deterministic 4:3 test image with smooth structure and some noise
+
+    Pure noise does not compress or filter like a photo, so random
+    low-resolution colour fields are upscaled and lightly noised instead.
+    """
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(width * 3 / 4))
+    channels = {'L': 1, 'RGB': 3, 'RGBA': 4}[mode]
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (max(height // 64, 2), max(width // 64, 2), channels), dtype=np.uint8)
+    smooth = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC).reshape(height, width, channels)
+    noise = rng.integers(-8, 9, smooth.shape, dtype=np.int16)
+    pixels = np.clip(smooth.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels[..., 0] if channels == 1 else pixels, mode)
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak-RSS counter; return False where unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    """Peak resident set size since the last reset (or process start)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def build_stages(image, kernel, encoding):
+    """Return (name, zero-argument callable) for each stage on this image
+
+    Inputs of later stages (the filtered image, the encoded PNG) are
+    computed once up front so each stage is timed on its own.
+    """
+    result = apply_convolution(image, kernel)
+    png = encode_image(result, **encoding)
+    return [
+        ('apply_convolution', lambda: apply_convolution(image, kernel)),
+        ('resize_image_for_display', lambda: resize_image_for_display(result, max_width=500, max_height=500)),
+        ('get_sample_region_calculation', lambda: get_sample_region_calculation(image, kernel)),
+        ('png_encode', lambda: encode_image(result, **encoding)),
+        ('base64_encode', lambda: base64.b64encode(png)),
+    ]
+
+
+def time_stage(func, repeat, warmup=1):
+    """Return (sorted durations in seconds, peak RSS bytes, whether RSS was reset)"""
+    for _ in range(warmup):
+        func()
+    per_stage_rss = reset_peak_rss()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return sorted(durations), peak_rss_bytes(), per_stage_rss
+
+
+def summarise(durations, megapixels):
+    """Latency percentiles in milliseconds and median throughput"""
+    ms = np.array(durations) * 1000
+    p50 = float(np.percentile(ms, 50))
+    return {
+        'p50_ms': round(p50, 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+        'min_ms': round(float(ms.min()), 3),
+        'mp_per_s': round(megapixels / (p50 / 1000), 2) if p50 > 0 else None,
+    }
+
+
+def git_commit():
+    """Current commit hash, with a -dirty suffix for uncommitted changes"""
+    root = Path(__file__).resolve().parent.parent
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+
+def environment():
+    """Library versions and machine details recorded with every run"""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run(sizes, modes, repeat, filter_name, compress_level):
+    """Benchmark every stage for every size and mode; return the result rows"""
+    kernel = KERNELS[filter_name]['matrix']
+    encoding = {'format': 'PNG', 'compress_level': compress_level}
+    rows = []
+    for megapixels in sizes:
+        for mode in modes:
+            image = synthetic_image(megapixels, mode)
+            actual_mp = image.size[0] * image.size[1] / 1e6
+            for stage, func in build_stages(image, kernel, encoding):
+                durations, peak_rss, per_stage_rss = time_stage(func, repeat)
+                row = {
+                    'stage': stage,
+                    'megapixels': megapixels,
+                    'mode': mode,
+                    'width': image.size[0],
+                    'height': image.size[1],
+                    'repeat': repeat,
+                    **summarise(durations, actual_mp),
+                    'peak_rss_mb': round(peak_rss / (1024 * 1024), 1),
+                    'peak_rss_per_stage': per_stage_rss,
+                }
+                rows.append(row)
+                print(
+                    f"{stage:<30}{megapixels:>6g} MP {mode:<5}"
+                    f"p50 {row['p50_ms']:>10.2f} ms  p90 {row['p90_ms']:>10.2f} ms  "
+                    f"{row['mp_per_s'] or 0:>9.1f} MP/s  peak RSS {row['peak_rss_mb']:>8.1f} MB",
+                    flush=True,
+                )
+            del image
+    return rows
+
+
+def row_key(row):
+    """Identify a result row across runs"""
+    return row['stage'], row['megapixels'], row['mode']
+
+
+def compare(old_path, new_path):
+    """Print the p50 change of every stage present in both result files"""
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    old_rows = {row_key(row): row for row in old['results']}
+    print(f"old: {old['commit']}\nnew: {new['commit']}")
+    print(f"{'stage':<30}{'MP':>6} {'mode':<5}{'old p50':>12}{'new p50':>12}{'speedup':>9}")
+    for row in new['results']:
+        before = old_rows.get(row_key(row))
+        if before is None:
+            continue
+        speedup = before['p50_ms'] / row['p50_ms'] if row['p50_ms'] else float('inf')
+        print(
+            f"{row['stage']:<30}{row['megapixels']:>6g} {row['mode']:<5}"
+            f"{before['p50_ms']:>10.2f}ms{row['p50_ms']:>10.2f}ms{speedup:>8.2f}x"
+        )
+
+
+def build_parser():
+    """Build the argument parser for the hot-path benchmark"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.hotpaths', description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--sizes', default=','.join(f"{size:g}" for size in DEFAULT_SIZES),
+        help='Comma-separated image sizes in megapixels (default: 0.3,2,12,50)',
+    )
+    parser.add_argument(
+        '--modes', default=','.join(DEFAULT_MODES),
+        help='Comma-separated PIL modes to test (default: L,RGB,RGBA)',
+    )
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per stage after one warm-up (default: 5)')
+    parser.add_argument('--filter', default='sharpen', choices=sorted(KERNELS), help='Kernel to apply (default: sharpen)')
+    parser.add_argument('--compress-level', type=int, default=1, help='PNG compression level, as in the app (default: 1)')
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files and exit')
+    return parser
+
+
+def main(argv=None):
+    """Run the benchmark (or a comparison) and return a process exit code"""
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    sizes = [float(size) for size in args.sizes.split(',')]
+    modes = [mode.strip().upper() for mode in args.modes.split(',')]
+    unknown = [mode for mode in modes if mode not in DEFAULT_MODES]
+    if unknown:
+        print(f"error: unsupported mode(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    commit = git_commit()
+    results = run(sizes, modes, args.repeat, args.filter, args.compress_level)
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'filter': args.filter,
+        'environment': environment(),
+        'results': results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
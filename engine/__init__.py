@@ -0,0 +1,70 @@
+"""Headless image convolution engine
+
+Importable without Streamlit so the same filters can run in batch jobs
+and non-UI workers. The Streamlit app in app.py is a thin layer on top.
+"""
+from . import timing
+from .kernels import KERNELS
+from .convolution import apply_convolution, get_sample_region_calculation
+from .decompose import KERNEL_REGISTRY, analyse_kernel, compile_kernel, filter_block, kernel_plan
+from .registry import KernelRegistry, load_kernel_file, normalize_kernel, parse_kernel_text, validate_kernel
+from .fft import fft_filter, measure_fft_crossover
+from .output import OUTPUT_MODES
+from .tiling import convolve_npy_file, convolve_parallel, convolve_tiled
+from .encoding import OUTPUT_FORMATS, encode_image
+from .display import display_size, resize_image_for_display
+from .derived import DerivedImage, build_pyramid
+from .fused import apply_convolutions, convolve_fused
+from .cache import ResultCache, cached_convolution, cached_convolutions, image_digest, result_key
+from .jobs import CancelledJob, JobQueue, QueueFull
+from .store import ImageStore
+from .spill import spill_convolution, spill_rgb
+from .video import convolve_clip, filter_frames, open_clip
+from .batch import append_to_zip, filter_upload
+
+__all__ = [
+    'CancelledJob',
+    'DerivedImage',
+    'ImageStore',
+    'JobQueue',
+    'KERNELS',
+    'KERNEL_REGISTRY',
+    'KernelRegistry',
+    'OUTPUT_FORMATS',
+    'OUTPUT_MODES',
+    'QueueFull',
+    'ResultCache',
+    'analyse_kernel',
+    'append_to_zip',
+    'apply_convolution',
+    'apply_convolutions',
+    'build_pyramid',
+    'cached_convolution',
+    'cached_convolutions',
+    'compile_kernel',
+    'convolve_clip',
+    'convolve_fused',
+    'convolve_npy_file',
+    'convolve_parallel',
+    'convolve_tiled',
+    'display_size',
+    'encode_image',
+    'fft_filter',
+    'filter_block',
+    'filter_frames',
+    'filter_upload',
+    'get_sample_region_calculation',
+    'image_digest',
+    'kernel_plan',
+    'load_kernel_file',
+    'measure_fft_crossover',
+    'normalize_kernel',
+    'open_clip',
+    'parse_kernel_text',
+    'resize_image_for_display',
+    'result_key',
+    'spill_convolution',
+    'spill_rgb',
+    'timing',
+    'validate_kernel',
+]
@@ -0,0 +1,6 @@
+"""Allow running the batch CLI as ``python -m engine``"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
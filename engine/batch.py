@@ -0,0 +1,69 @@
+"""Filtering a batch of uploaded images into one ZIP archive
+
+Each upload is one unit of work: ``filter_upload`` decodes it once, runs
+every requested kernel over one fused strip read (through the result cache
+when one is given) and returns the encoded results. ``append_to_zip``
+adds finished results to the archive on disk as they arrive, so only the
+results in flight are ever held in memory.
+"""
+import zipfile
+from pathlib import Path, PurePath
+
+from .cache import cached_convolutions, image_digest
+from .derived import DerivedImage
+from .encoding import OUTPUT_FORMATS, encode_image
+from .output import CLIP
+
+
+def result_name(filename, filter_name, format='PNG'):
+    """Archive member name for one filter applied to one upload"""
+    return f"{PurePath(filename).stem}_{filter_name}.{OUTPUT_FORMATS[format]['extension']}"
+
+
+def filter_upload(data, filename, kernels, cache=None, output=CLIP, encoding=None, **options):
+    """Apply every kernel in a {name: matrix} dict to encoded image bytes
+
+    Returns a list of (archive name, encoded bytes), one per kernel.
+    ``encoding`` holds ``encode_image`` arguments (PNG by default) and
+    ``options`` are passed on to ``apply_convolutions``.
+    """
+    encoding = encoding or {'format': 'PNG'}
+    derived = DerivedImage(data)
+    names = list(kernels)
+    results = cached_convolutions(
+        lambda: derived.rgb, [kernels[name] for name in names], image_digest(data), cache, output=output, **options
+    )
+    return [
+        (result_name(filename, name, encoding.get('format', 'PNG')), encode_image(result, **encoding))
+        for name, result in zip(names, results)
+    ]
+
+
+def unique_name(name, taken):
+    """Return name, or name with a numeric suffix if it is already in taken"""
+    path = PurePath(name)
+    candidate = name
+    counter = 1
+    while candidate in taken:
+        candidate = f"{path.stem}_{counter}{path.suffix}"
+        counter += 1
+    return candidate
+
+
+def append_to_zip(zip_path, entries):
+    """Add (name, bytes) entries to a ZIP file, creating it if needed; return the names used
+
+    Members are stored uncompressed: PNG, JPEG and WebP data would not
+    shrink further. Names already in the archive get a numeric suffix.
+    """
+    zip_path = Path(zip_path)
+    mode = 'a' if zip_path.exists() else 'w'
+    used = []
+    with zipfile.ZipFile(zip_path, mode, compression=zipfile.ZIP_STORED) as archive:
+        taken = set(archive.namelist())
+        for name, data in entries:
+            name = unique_name(name, taken)
+            archive.writestr(name, data)
+            taken.add(name)
+            used.append(name)
+    return used
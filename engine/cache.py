@@ -0,0 +1,199 @@
+"""Content-addressed LRU cache for convolution results"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .convolution import apply_convolution
+from .fused import apply_convolutions
+from .output import CLIP
+from .timing import span
+
+
+def image_digest(data):
+    """Return a hex digest identifying the raw bytes of an uploaded image"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def result_key(digest, kernel, output=CLIP):
+    """Build the cache key for an image digest, kernel matrix and output mode"""
+    kernel = np.ascontiguousarray(kernel)
+    h = hashlib.sha256(digest.encode())
+    h.update(f"{kernel.dtype.str}{kernel.shape}{output}".encode())
+    h.update(kernel.tobytes())
+    return h.hexdigest()
+
+
+def _resolve(image):
+    """Call a deferred image loader, or return an image unchanged"""
+    return image() if callable(image) else image
+
+
+def _image_nbytes(image):
+    """Approximate decoded size of a PIL image in bytes"""
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+class ResultCache:
+    """Size-bounded LRU cache with an optional on-disk tier
+
+    Entries are keyed by ``result_key`` so identical uploads share results
+    across sessions. Cached images are shared between callers and must be
+    treated as read-only.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None, max_disk_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._entries = OrderedDict()
+        self._disk_entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            # Rebuild the disk index oldest-first so eviction order survives restarts
+            for path in sorted(self.disk_dir.glob('*.npy'), key=lambda p: p.stat().st_mtime):
+                size = path.stat().st_size
+                self._disk_entries[path.stem] = size
+                self._disk_bytes += size
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        """Bytes currently held by the in-memory tier"""
+        return self._bytes
+
+    def get(self, key):
+        """Return the cached image for key, or None on a miss"""
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+
+        image = self._load_from_disk(key)
+        with self._lock:
+            if image is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._put_memory(key, image)
+        return image
+
+    def put(self, key, image):
+        """Store an image under key in every configured tier"""
+        self._put_memory(key, image)
+        self._save_to_disk(key, image)
+
+    def clear(self):
+        """Drop all in-memory entries (the disk tier is left intact)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put_memory(self, key, image):
+        size = _image_nbytes(image)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = image
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= _image_nbytes(evicted)
+
+    def _disk_path(self, key):
+        return self.disk_dir / f"{key}.npy"
+
+    def _load_from_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        with self._lock:
+            if key not in self._disk_entries:
+                return None
+            self._disk_entries.move_to_end(key)
+        try:
+            # Mapped rather than read, so a hit costs one copy into the image
+            array = np.load(self._disk_path(key), mmap_mode='r', allow_pickle=False)
+        except (OSError, ValueError):
+            with self._lock:
+                self._disk_bytes -= self._disk_entries.pop(key, 0)
+            return None
+        return Image.fromarray(array)
+
+    def _save_to_disk(self, key, image):
+        if self.disk_dir is None:
+            return
+        with self._lock:
+            if key in self._disk_entries:
+                return
+        path = self._disk_path(key)
+        # Write to a temporary name first so readers never see a partial file
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(image), allow_pickle=False)
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+        with self._lock:
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk_entries) > 1:
+                old_key, old_size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= old_size
+                try:
+                    self._disk_path(old_key).unlink()
+                except FileNotFoundError:
+                    pass
+
+
+def cached_convolution(image, kernel, digest, cache, output=CLIP, **options):
+    """Apply a kernel through cache, computing the result only on a miss
+
+    ``digest`` identifies the source image (see ``image_digest``). When
+    ``cache`` is None the convolution is always computed. ``options`` are
+    passed to ``apply_convolution`` and must not change the output.
+    ``image`` may also be a zero-argument callable returning the image, so
+    a lazily decoded source is only decoded on a miss.
+    """
+    if cache is None:
+        return apply_convolution(_resolve(image), kernel, output=output, **options)
+
+    key = result_key(digest, kernel, output)
+    with span('cache_get'):
+        result = cache.get(key)
+    if result is None:
+        result = apply_convolution(_resolve(image), kernel, output=output, **options)
+        with span('cache_put'):
+            cache.put(key, result)
+    return result
+
+
+def cached_convolutions(image, kernels, digest, cache, output=CLIP, **options):
+    """Apply several kernels through cache, fusing all misses into one strip read"""
+    if cache is None:
+        return apply_convolutions(_resolve(image), kernels, output=output, **options)
+
+    keys = [result_key(digest, kernel, output) for kernel in kernels]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        computed = apply_convolutions(_resolve(image), [kernels[i] for i in missing], output=output, **options)
+        for i, result in zip(missing, computed):
+            cache.put(keys[i], result)
+            results[i] = result
+    return results
@@ -0,0 +1,113 @@
+"""Command-line entry point for applying a filter to a directory of images and clips"""
+import argparse
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+from .convolution import apply_convolution
+from .kernels import KERNELS
+from .output import OUTPUT_MODES
+from .video import ANIMATION_EXTENSIONS, VIDEO_EXTENSIONS, convolve_clip, output_suffix
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+
+def iter_images(input_dir):
+    """Yield image files in a directory in a stable order"""
+    for path in sorted(Path(input_dir).iterdir()):
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+            yield path
+
+
+def iter_clips(input_dir):
+    """Yield video and animated GIF files in a directory in a stable order"""
+    extensions = VIDEO_EXTENSIONS | ANIMATION_EXTENSIONS
+    for path in sorted(Path(input_dir).iterdir()):
+        if path.is_file() and path.suffix.lower() in extensions:
+            yield path
+
+
+def clip_target(path, output_dir, filter_name):
+    """Output path for a filtered clip: short GIFs stay GIFs, everything else becomes MP4"""
+    return output_dir / f"{path.stem}_{filter_name}{output_suffix(path)}"
+
+
+def build_parser():
+    """Build the argument parser for the batch CLI"""
+    parser = argparse.ArgumentParser(
+        prog='python -m engine',
+        description='Apply a convolution filter to every image, video and GIF in a directory',
+    )
+    parser.add_argument('filter', choices=sorted(KERNELS), help='Name of the kernel to apply')
+    parser.add_argument('input_dir', help='Directory containing the source images')
+    parser.add_argument('output_dir', help='Directory to write the processed images to')
+    parser.add_argument(
+        '--format', default='png', choices=['png', 'jpeg', 'webp'],
+        help='Output image format (default: png)',
+    )
+    parser.add_argument(
+        '--output', default='clip', choices=list(OUTPUT_MODES),
+        help='How filter responses map to pixels (default: clip)',
+    )
+    parser.add_argument(
+        '--tile-rows', type=int, default=None, metavar='N',
+        help='Filter in strips of N rows to bound memory on very large images',
+    )
+    parser.add_argument(
+        '--workers', type=int, default=None, metavar='N',
+        help='Filter strips of each image (or frames of each clip) on N threads',
+    )
+    parser.add_argument(
+        '--target-fps', type=float, default=None, metavar='FPS',
+        help='Report whether each clip was filtered at least this fast',
+    )
+    return parser
+
+
+def main(argv=None):
+    """Run the batch CLI and return a process exit code"""
+    args = build_parser().parse_args(argv)
+
+    input_dir = Path(args.input_dir)
+    if not input_dir.is_dir():
+        print(f"error: {input_dir} is not a directory", file=sys.stderr)
+        return 2
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    kernel = KERNELS[args.filter]['matrix']
+    extension = 'jpg' if args.format == 'jpeg' else args.format
+    processed = 0
+    failed = 0
+
+    for path in iter_images(input_dir):
+        target = output_dir / f"{path.stem}_{args.filter}.{extension}"
+        try:
+            with Image.open(path) as image:
+                result = apply_convolution(image, kernel, tile_rows=args.tile_rows, workers=args.workers, output=args.output)
+            result.save(target, format=args.format.upper())
+        except (OSError, ValueError) as exc:
+            print(f"error: {path.name}: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"{path.name} -> {target}")
+        processed += 1
+
+    for path in iter_clips(input_dir):
+        target = clip_target(path, output_dir, args.filter)
+        try:
+            stats = convolve_clip(path, target, kernel, workers=args.workers, output=args.output)
+        except (OSError, ValueError) as exc:
+            print(f"error: {path.name}: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+        report = f"{path.name} -> {target} ({stats['frames']} frames, {stats['fps']:.1f} fps"
+        if args.target_fps:
+            report += f", target {args.target_fps:g} fps {'met' if stats['fps'] >= args.target_fps else 'missed'}"
+        print(report + ")")
+        processed += 1
+
+    print(f"Processed {processed} file(s), {failed} failed")
+    return 1 if failed else 0
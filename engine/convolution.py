@@ -0,0 +1,111 @@
+"""Core convolution routines with no UI dependencies"""
+import cv2
+import numpy as np
+from PIL import Image
+
+from .decompose import filter_block
+from .output import CLIP
+from .scratch import scratch
+from .timing import timed
+from .tiling import convolve_parallel, convolve_tiled, normalize_mode, to_rgb
+
+
+@timed('convolve')
+def apply_convolution(image, kernel, tile_rows=None, workers=None, output=CLIP):
+    """Apply convolution filter to image
+
+    With ``tile_rows`` set the image is filtered in strips of that many
+    rows (see engine.tiling), keeping memory bounded for huge images.
+    With ``workers`` above 1 the strips are filtered on a thread pool.
+    ``output`` chooses how responses map to pixels: clip, abs or minmax
+    (see engine.output).
+    """
+    if isinstance(image, Image.Image):
+        image = normalize_mode(image)
+    if workers and workers > 1:
+        return Image.fromarray(convolve_parallel(image, kernel, workers=workers, strip_rows=tile_rows, output=output))
+    if tile_rows:
+        return Image.fromarray(convolve_tiled(image, kernel, strip_rows=tile_rows, output=output))
+    
+    # A view when image is already an array; PIL images are copied once
+    img_array = np.asarray(image)
+    
+    # Convert to RGB if needed, into a reused scratch buffer
+    shape = img_array.shape[:2] + (3,)
+    if img_array.ndim == 2 or img_array.shape[2] == 4:
+        img_array = to_rgb(img_array, dst=scratch('rgb', shape))
+    
+    # Filter each channel straight into uint8, using a cheaper decomposition
+    # when the kernel allows; clipping happens inside that single pass
+    filtered = filter_block(img_array, kernel, output=output, dst=scratch('output', shape))
+    
+    # Pillow copies 3-channel arrays into its own storage, so the scratch
+    # output is free to be reused by the next call
+    return Image.fromarray(filtered)
+
+@timed('sample_calculation')
+def get_sample_region_calculation(image, kernel, x=None, y=None):
+    """Get a sample calculation showing the convolution process
+
+    ``image`` may be a PIL image or an array; a 2-D array such as
+    ``DerivedImage.gray`` is used directly, so a probe only reads the
+    kernel-sized neighbourhood and costs O(1) in the image size.
+    """
+    if isinstance(image, Image.Image):
+        image = normalize_mode(image)
+    img_array = np.asarray(image)
+    
+    # Convert to grayscale for simpler calculation display
+    if len(img_array.shape) == 3:
+        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    else:
+        gray = img_array
+    
+    h, w = gray.shape
+    rows, cols = kernel.shape
+    top, left = rows // 2, cols // 2
+    
+    # Select a region from the middle if not specified
+    if x is None or y is None:
+        x = w // 2
+        y = h // 2
+    
+    # Keep the whole kernel window inside the image where it fits
+    x = max(left, min(x, w - (cols - left))) if w >= cols else min(max(x, 0), w - 1)
+    y = max(top, min(y, h - (rows - top))) if h >= rows else min(max(y, 0), h - 1)
+    
+    # Extract the kernel-sized region around (x, y); on images smaller than
+    # the kernel the borders are reflected the same way filter2D does
+    row_index = [cv2.borderInterpolate(i, h, cv2.BORDER_REFLECT_101) for i in range(y - top, y - top + rows)]
+    col_index = [cv2.borderInterpolate(j, w, cv2.BORDER_REFLECT_101) for j in range(x - left, x - left + cols)]
+    region = gray[np.ix_(row_index, col_index)].astype(float)
+    
+    # Calculate convolution step by step
+    steps = []
+    calculation_parts = []
+    
+    for i in range(rows):
+        for j in range(cols):
+            pixel_val = region[i, j]
+            kernel_val = kernel[i, j]
+            product = pixel_val * kernel_val
+            steps.append({
+                'position': f"[{i},{j}]",
+                'pixel': pixel_val,
+                'kernel': kernel_val,
+                'product': product
+            })
+            calculation_parts.append(f"{pixel_val:.0f} × {kernel_val:.3f}")
+    
+    total = np.sum(region * kernel)
+    final_value = np.clip(total, 0, 255)
+    
+    return {
+        'region': region,
+        'kernel': kernel,
+        'steps': steps,
+        'calculation_parts': calculation_parts,
+        'total': total,
+        'final_value': final_value,
+        'position': (x, y)
+    }
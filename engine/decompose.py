@@ -0,0 +1,205 @@
+"""Kernel decomposition into cheaper equivalent filter passes
+
+A dense ``cv2.filter2D`` costs O(rows × cols) per pixel. Many useful kernels
+have structure that allows a cheaper exact evaluation:
+
+* box kernels (all taps equal) run as a running-sum box filter, O(1) per pixel
+* "a·centre + b·box" kernels (sharpen, Laplacian) combine the input with a
+  box sum
+* rank-1 kernels (Gaussian, motion blur) run as a row pass then a column pass
+* low-rank kernels run as a sum of a few separable passes
+* any other kernel above the FFT crossover size runs through engine.fft
+
+Plans are chosen by ``analyse_kernel`` and memoised in ``KERNEL_REGISTRY``
+(see engine.registry), so repeated calls only pay for a dictionary lookup.
+"""
+import cv2
+import numpy as np
+
+from .fft import fft_filter, use_fft
+from .output import CLIP, check_output_mode, saturate_uint8, to_uint8
+from .registry import RANK_TOLERANCE, KernelRegistry
+from .scratch import scratch
+
+DENSE = 'dense'
+BOX = 'box'
+CENTER_BOX = 'center_box'
+SEPARABLE = 'separable'
+LOW_RANK = 'low_rank'
+FFT = 'fft'
+
+# Below this many taps a dense 3×3 filter2D beats box-sum-plus-combine
+# (measured on a 12 MP RGB image: 58 ms dense vs 130 ms combined at 3×3)
+CENTER_BOX_MIN_AREA = 25
+
+def _center_box_weights(kernel):
+    """Return (a, b) if kernel == a·delta(anchor) + b·ones, else None"""
+    rows, cols = kernel.shape
+    if rows * cols < 2:
+        return None
+    anchor = (rows // 2, cols // 2)
+    others = np.delete(kernel.ravel(), anchor[0] * cols + anchor[1])
+    b = others[0]
+    if not np.allclose(others, b, rtol=0, atol=RANK_TOLERANCE * max(1.0, abs(b))):
+        return None
+    return float(kernel[anchor] - b), float(b)
+
+
+def analyse_kernel(kernel):
+    """Choose the cheapest exact way to apply a 2-D kernel
+
+    Returns a plan dict whose ``method`` is one of DENSE, BOX, CENTER_BOX,
+    SEPARABLE, LOW_RANK or FFT, with the parameters that method needs.
+    """
+    kernel = np.ascontiguousarray(kernel, dtype=np.float32)
+    rows, cols = kernel.shape
+    area = rows * cols
+    plan = {'method': DENSE, 'kernel': kernel, 'ksize': (cols, rows)}
+
+    weights = _center_box_weights(kernel)
+    if weights is not None:
+        a, b = weights
+        if abs(a) <= RANK_TOLERANCE * max(1.0, abs(b)) and abs(b * area - 1) <= RANK_TOLERANCE:
+            # Normalised box: OpenCV's running-sum box filter, exact for uint8
+            plan['method'] = BOX
+            return plan
+        if area >= CENTER_BOX_MIN_AREA:
+            plan.update(method=CENTER_BOX, center_weight=a, box_weight=b)
+            return plan
+
+    # Rank of the kernel from its singular values
+    u, s, vt = np.linalg.svd(kernel.astype(np.float64))
+    if s[0] == 0:
+        return plan
+    rank = int(np.sum(s > RANK_TOLERANCE * s[0]))
+    passes = [
+        ((vt[i] * np.sqrt(s[i])).astype(np.float32), (u[:, i] * np.sqrt(s[i])).astype(np.float32))
+        for i in range(rank)
+    ]
+
+    if rank == 1 and area > rows + cols:
+        plan.update(method=SEPARABLE, passes=passes)
+    elif rank > 1 and 2 * rank * (rows + cols) < area:
+        # Each extra pass also accumulates in float32, hence the factor of two
+        plan.update(method=LOW_RANK, passes=passes)
+    elif use_fft(kernel):
+        plan['method'] = FFT
+    return plan
+
+
+KERNEL_REGISTRY = KernelRegistry(analyse_kernel)
+
+
+def kernel_plan(kernel):
+    """Return the memoised plan for a kernel, analysing it on first use"""
+    return KERNEL_REGISTRY.compile(kernel)['plan']
+
+
+def compile_kernel(kernel):
+    """Return the compiled registry entry for a kernel (see engine.registry)"""
+    return KERNEL_REGISTRY.compile(kernel)
+
+
+def _is_integer_kernel(kernel):
+    return bool(np.all(kernel == np.round(kernel)))
+
+
+def accumulator_depth(kernel):
+    """int16 when the kernel is integer and cannot overflow it, else float32"""
+    if _is_integer_kernel(kernel) and np.abs(kernel).sum() * 255 <= 32767:
+        return cv2.CV_16S
+    return cv2.CV_32F
+
+
+def apply_plan(block, plan, dst=None):
+    """Filter a uint8 block according to a plan, saturating into uint8"""
+    method = plan['method']
+    ksize = plan['ksize']
+
+    if method == BOX:
+        return cv2.boxFilter(block, -1, ksize, dst=dst)
+
+    if method == CENTER_BOX:
+        # int16 box sums are exact while the window cannot overflow them
+        box_sum = _box_sum(block, ksize)
+        return cv2.addWeighted(block, plan['center_weight'], box_sum, plan['box_weight'], 0.0, dst=dst, dtype=cv2.CV_8U)
+
+    if method == SEPARABLE:
+        row, col = plan['passes'][0]
+        return cv2.sepFilter2D(block, -1, row, col, dst=dst)
+
+    if method == LOW_RANK:
+        return saturate_uint8(apply_plan_signed(block, plan), dst=dst)
+
+    if method == FFT:
+        return saturate_uint8(fft_filter(block, plan['kernel'], signed=True), dst=dst)
+
+    return cv2.filter2D(block, -1, plan['kernel'], dst=dst)
+
+
+def _box_sum(block, ksize):
+    """Unnormalised box sum into a scratch buffer; int16 while that is exact"""
+    if ksize[0] * ksize[1] * 255 <= 32767:
+        return cv2.boxFilter(block, cv2.CV_16S, ksize, normalize=False, dst=scratch('box_sum', block.shape, np.int16))
+    return cv2.boxFilter(block, cv2.CV_32F, ksize, normalize=False, dst=scratch('box_sum', block.shape, np.float32))
+
+
+def apply_plan_signed(block, plan):
+    """Filter a uint8 block according to a plan into a signed accumulator
+
+    Returns int16 where that is exact and float32 otherwise, keeping the
+    negative responses that the uint8 path saturates away. The accumulator
+    is a per-thread scratch buffer (see engine.scratch), valid until the
+    next call on the same thread.
+    """
+    method = plan['method']
+    ksize = plan['ksize']
+
+    if method == FFT:
+        return fft_filter(block, plan['kernel'], signed=True)
+
+    depth = cv2.CV_32F if method != DENSE else accumulator_depth(plan['kernel'])
+    acc = scratch('accumulator', block.shape, np.int16 if depth == cv2.CV_16S else np.float32)
+
+    if method == BOX:
+        return cv2.boxFilter(block, cv2.CV_32F, ksize, dst=acc)
+
+    if method == CENTER_BOX:
+        box_sum = _box_sum(block, ksize)
+        return cv2.addWeighted(block, plan['center_weight'], box_sum, plan['box_weight'], 0.0, dst=acc, dtype=cv2.CV_32F)
+
+    if method == SEPARABLE:
+        row, col = plan['passes'][0]
+        return cv2.sepFilter2D(block, cv2.CV_32F, row, col, dst=acc)
+
+    if method == LOW_RANK:
+        (row, col), *rest = plan['passes']
+        cv2.sepFilter2D(block, cv2.CV_32F, row, col, dst=acc)
+        component = scratch('component', block.shape, np.float32)
+        for row, col in rest:
+            cv2.sepFilter2D(block, cv2.CV_32F, row, col, dst=component)
+            cv2.add(acc, component, dst=acc)
+        return acc
+
+    return cv2.filter2D(block, depth, plan['kernel'], dst=acc)
+
+
+def filter_block(block, kernel, output=CLIP, value_range=None, dst=None):
+    """Filter a uint8 block with a kernel using its cheapest plan
+
+    ``output`` selects how responses map to uint8 (see engine.output); for
+    ``minmax`` on part of an image pass the global ``value_range``. The
+    result is written into ``dst`` when given.
+    """
+    check_output_mode(output)
+    plan = kernel_plan(kernel)
+    if output == CLIP:
+        return apply_plan(block, plan, dst=dst)
+    return to_uint8(apply_plan_signed(block, plan), output, value_range=value_range, dst=dst)
+
+
+def block_response_range(block, kernel, start=0, stop=None):
+    """(min, max) signed response of a block over rows [start, stop)"""
+    acc = apply_plan_signed(block, kernel_plan(kernel))
+    acc = acc[start:stop]
+    return float(acc.min()), float(acc.max())
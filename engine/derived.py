@@ -0,0 +1,164 @@
+"""Per-upload derived data: RGB array, grayscale plane and image pyramid
+
+Everything here is computed at most once per upload so interactive reruns
+(thumbnails, sample calculations, probes) never decode the image again.
+Decoding is deferred until a plane is actually needed, so a preview of a
+large JPEG costs a reduced-size decode rather than a full one.
+"""
+import io
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .cache import image_digest
+from .display import display_size
+from .spill import spill_gray, spill_path, spill_rgb
+from .tiling import normalize_mode, to_rgb
+from .timing import span
+
+# Stop halving once the longest side of a pyramid level is at most this
+PYRAMID_MIN_SIDE = 128
+
+
+def build_pyramid(rgb, min_side=PYRAMID_MIN_SIDE):
+    """Return successively halved copies of an image, excluding the original"""
+    levels = []
+    level = rgb
+    while max(level.shape[:2]) // 2 >= min_side:
+        height, width = level.shape[:2]
+        # INTER_AREA averages each 2x2 block, the usual mip-map filter
+        level = cv2.resize(level, (width // 2, height // 2), interpolation=cv2.INTER_AREA)
+        levels.append(level)
+    return levels
+
+
+class DerivedImage:
+    """Decoded planes and pyramid for one upload, built lazily and reused on rerun
+
+    ``source`` is the encoded image bytes or an open PIL image. Construction
+    only reads the header. JPEG thumbnails come from a reduced-size (draft)
+    decode, and the full-resolution decode happens the first time ``rgb``,
+    ``gray`` or ``pyramid`` is read.
+
+    With ``spill_dir`` (bytes sources only) the full-resolution ``rgb`` and
+    ``gray`` planes are written to memory-mapped .npy files named by the
+    image digest (see engine.spill) instead of living on the heap, and
+    processes sharing the directory reuse each other's decodes.
+    """
+
+    def __init__(self, source, spill_dir=None):
+        if isinstance(source, Image.Image):
+            self._data = None
+            self._image = source
+            self.spill_dir = None
+        else:
+            self._data = bytes(source)
+            self._image = None
+            self.spill_dir = spill_dir
+        header = self._open()
+        self.size = header.size
+        self.mode = header.mode
+        self.format = header.format
+        self._rgb = None
+        self._gray = None
+        self._pyramid = None
+        self._thumbnails = {}
+        self._lock = threading.Lock()
+
+    def _open(self):
+        """Return a fresh, not yet decoded PIL image for the source"""
+        if self._data is None:
+            return self._image
+        return Image.open(io.BytesIO(self._data))
+
+    @property
+    def decoded(self):
+        """Whether the full-resolution image has been decoded"""
+        return self._rgb is not None
+
+    @property
+    def rgb(self):
+        """Full-resolution RGB array, decoded on first use"""
+        if self._rgb is None:
+            with self._lock:
+                if self._rgb is None:
+                    with span('decode', spilled=self.spill_dir is not None):
+                        if self.spill_dir is not None:
+                            self._rgb = spill_rgb(self._open(), self._spill_path('rgb'))
+                        else:
+                            image = self._open()
+                            image.load()
+                            self._rgb = to_rgb(np.asarray(normalize_mode(image)))
+        return self._rgb
+
+    @property
+    def gray(self):
+        """Full-resolution grayscale plane"""
+        if self._gray is None:
+            if self.spill_dir is not None:
+                self._gray = spill_gray(self.rgb, self._spill_path('gray'))
+            else:
+                self._gray = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    def _spill_path(self, plane):
+        return spill_path(self.spill_dir, f"{image_digest(self._data)}.{plane}")
+
+    @property
+    def pyramid(self):
+        """Successively halved copies of ``rgb`` (see build_pyramid)"""
+        if self._pyramid is None:
+            self._pyramid = build_pyramid(self.rgb)
+        return self._pyramid
+
+    @property
+    def nbytes(self):
+        """Heap bytes held by the arrays decoded so far (mapped planes excluded)"""
+        arrays = [self._rgb, self._gray] + (self._pyramid or [])
+        return sum(array.nbytes for array in arrays if array is not None and not isinstance(array, np.memmap))
+
+    @property
+    def encoded_nbytes(self):
+        """Bytes held by the encoded source, if it was given as bytes"""
+        return len(self._data) if self._data is not None else 0
+
+    def release(self):
+        """Drop the decoded planes; they are decoded again from bytes on next use
+
+        Only sources given as bytes can be released; returns the bytes freed.
+        """
+        if self._data is None:
+            return 0
+        with self._lock:
+            freed = self.nbytes
+            self._rgb = None
+            self._gray = None
+            self._pyramid = None
+        return freed
+
+    def level_for(self, width, height):
+        """Return the smallest pyramid level at least width x height"""
+        best = self.rgb
+        for level in self.pyramid:
+            if level.shape[1] < width or level.shape[0] < height:
+                break
+            best = level
+        return best
+
+    def thumbnail(self, max_width=500, max_height=500):
+        """Display-size PIL image, resampled from the cheapest adequate source"""
+        key = (max_width, max_height)
+        if key not in self._thumbnails:
+            size = display_size(self.size[0], self.size[1], max_width, max_height)
+            with span('thumbnail'):
+                if self._rgb is None and self._data is not None and self.format == 'JPEG':
+                    # libjpeg scales by 1/2, 1/4 or 1/8 while decoding, never below size
+                    source = self._open()
+                    source.draft('RGB', size)
+                    source = Image.fromarray(to_rgb(np.asarray(normalize_mode(source))))
+                else:
+                    source = Image.fromarray(self.level_for(*size))
+                self._thumbnails[key] = source.resize(size, Image.Resampling.LANCZOS)
+        return self._thumbnails[key]
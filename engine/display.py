@@ -0,0 +1,38 @@
+"""Helpers for preparing images for on-screen display"""
+from PIL import Image
+
+from .timing import timed
+
+
+def display_size(width, height, max_width=500, max_height=500):
+    """Compute the (width, height) an image is shown at, keeping aspect ratio"""
+    # Calculate aspect ratio
+    aspect = width / height
+    
+    # Resize to fixed dimensions while maintaining aspect ratio
+    if aspect > 1:
+        # Wider image
+        new_width = min(width, max_width)
+        new_height = int(new_width / aspect)
+    else:
+        # Taller image
+        new_height = min(height, max_height)
+        new_width = int(new_height * aspect)
+    
+    # Ensure it doesn't exceed max dimensions
+    if new_width > max_width:
+        new_width = max_width
+        new_height = int(new_width / aspect)
+    if new_height > max_height:
+        new_height = max_height
+        new_width = int(new_height * aspect)
+    
+    return new_width, new_height
+
+
+@timed('resize')
+def resize_image_for_display(image, max_width=500, max_height=500):
+    """Resize image to fixed display size"""
+    new_size = display_size(image.size[0], image.size[1], max_width, max_height)
+    image = image.resize(new_size, Image.Resampling.LANCZOS)
+    return image
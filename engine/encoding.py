@@ -0,0 +1,32 @@
+"""Encoding processed images for download and display"""
+import io
+
+from .timing import timed
+
+# Formats offered for processed output, with their MIME type and file extension
+OUTPUT_FORMATS = {
+    'PNG': {'mime': 'image/png', 'extension': 'png'},
+    'JPEG': {'mime': 'image/jpeg', 'extension': 'jpg'},
+    'WEBP': {'mime': 'image/webp', 'extension': 'webp'},
+}
+
+
+@timed('encode')
+def encode_image(image, format='PNG', compress_level=6, quality=90):
+    """Encode a PIL image to bytes in one of OUTPUT_FORMATS
+
+    ``compress_level`` (0-9) only applies to PNG, where lower levels trade
+    file size for much faster zlib encoding. ``quality`` applies to JPEG
+    and WebP.
+    """
+    if format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {format}")
+
+    buf = io.BytesIO()
+    if format == 'PNG':
+        image.save(buf, format='PNG', compress_level=compress_level)
+    else:
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(buf, format=format, quality=quality)
+    return buf.getvalue()
@@ -0,0 +1,95 @@
+"""Fused multi-filter convolution: several kernels sharing one strip read
+
+Every strip is read and converted to RGB once, then filtered with each
+kernel in turn. Only the read and the colour conversion are shared; the
+filtering itself still costs one pass per kernel, so the total is about
+the sum of the separate filters. The saving is largest for PIL sources
+that need a mode conversion, and close to nothing for RGB arrays.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .decompose import block_response_range, filter_block
+from .output import CLIP, MINMAX, check_output_mode, merge_ranges
+from .scratch import scratch
+from .timing import timed
+from .tiling import (
+    DEFAULT_STRIP_ROWS,
+    iter_strips,
+    kernel_halo,
+    normalize_mode,
+    parallel_strip_rows,
+    read_strip,
+    run_strips,
+    source_shape,
+)
+
+
+def fused_halo(kernels):
+    """Return the (above, below) halo covering every kernel"""
+    halos = [kernel_halo(kernel) for kernel in kernels]
+    return max(above for above, _ in halos), max(below for _, below in halos)
+
+
+def convolve_strip_multi(src, kernels, start, stop, dsts, output=CLIP, value_ranges=None):
+    """Filter rows [start, stop) of src with each kernel into its dst"""
+    # One read and one colour conversion shared by all kernels
+    block, offset = read_strip(src, start, stop, *fused_halo(kernels))
+    value_ranges = value_ranges or [None] * len(kernels)
+    for kernel, dst, value_range in zip(kernels, dsts, value_ranges):
+        filtered = filter_block(block, kernel, output=output, value_range=value_range, dst=scratch('strip_output', block.shape))
+        dst[start:stop] = filtered[offset:offset + (stop - start)]
+
+
+def strip_response_ranges_multi(src, kernels, start, stop):
+    """Per-kernel (min, max) responses over rows [start, stop) from one read"""
+    block, offset = read_strip(src, start, stop, *fused_halo(kernels))
+    return [block_response_range(block, kernel, offset, offset + (stop - start)) for kernel in kernels]
+
+
+def convolve_fused(src, kernels, strip_rows=None, workers=None, output=CLIP, dsts=None):
+    """Convolve a PIL image or uint8 array with several kernels, reading each strip once
+
+    Returns one HxWx3 uint8 array per kernel, each identical to filtering
+    with that kernel alone, written into ``dsts`` when given. With
+    ``workers`` above 1 strips are processed on a thread pool.
+    """
+    check_output_mode(output)
+    if isinstance(src, Image.Image):
+        src.load()
+
+    height, width = source_shape(src)
+    above, below = fused_halo(kernels)
+    if strip_rows is None:
+        strip_rows = parallel_strip_rows(height, workers) if workers and workers > 1 else DEFAULT_STRIP_ROWS
+    strip_rows = max(strip_rows, above + below + 1)
+
+    if dsts is None:
+        dsts = [np.empty((height, width, 3), dtype=np.uint8) for _ in kernels]
+    strips = list(iter_strips(height, strip_rows))
+
+    with ThreadPoolExecutor(max_workers=workers or 1, thread_name_prefix='convolve-fused') as pool:
+        value_ranges = None
+        if output == MINMAX:
+            # Transpose per-strip lists of ranges into one merged range per kernel
+            strip_ranges = run_strips(pool, strips, lambda start, stop: strip_response_ranges_multi(src, kernels, start, stop))
+            value_ranges = [merge_ranges(ranges) for ranges in zip(*strip_ranges)]
+        run_strips(
+            pool, strips,
+            lambda start, stop: convolve_strip_multi(src, kernels, start, stop, dsts, output=output, value_ranges=value_ranges),
+        )
+    return dsts
+
+
+@timed('convolve_fused')
+def apply_convolutions(image, kernels, tile_rows=None, workers=None, output=CLIP):
+    """Apply several convolution filters to image, sharing each strip read"""
+    if isinstance(image, Image.Image):
+        image = normalize_mode(image)
+    width, height = image.size if isinstance(image, Image.Image) else (image.shape[1], image.shape[0])
+    # Pillow copies 3-channel arrays into its own storage, so the outputs can be scratch
+    dsts = [scratch(f'output_{i}', (height, width, 3)) for i in range(len(kernels))]
+    results = convolve_fused(image, kernels, strip_rows=tile_rows, workers=workers, output=output, dsts=dsts)
+    return [Image.fromarray(result) for result in results]
@@ -0,0 +1,267 @@
+"""Background job queue with backpressure, status polling and cancellation
+
+Jobs are queued per owner (for example one owner per UI session) and
+workers take them round-robin across owners, so one user submitting many
+large jobs cannot starve everyone else. The queue is bounded: ``submit``
+raises ``QueueFull`` instead of letting work pile up without limit.
+Finished jobs wait for their owner to collect them, within a byte budget
+and an age limit, so results nobody collects cannot pin memory for long.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from . import timing
+from .scratch import release_scratch
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+def result_nbytes(result):
+    """Approximate memory held by a job result: images, arrays, bytes and lists of them"""
+    if isinstance(result, Image.Image):
+        return result.size[0] * result.size[1] * len(result.getbands())
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    if isinstance(result, (list, tuple)):
+        return sum(result_nbytes(item) for item in result)
+    return getattr(result, 'nbytes', 0)
+
+
+class QueueFull(Exception):
+    """Raised when the queue already holds its maximum number of pending jobs"""
+
+
+class CancelledJob(Exception):
+    """Raised by JobQueue.result for a job that was cancelled"""
+
+
+class Job:
+    """A unit of work tracked by JobQueue"""
+
+    def __init__(self, owner, func, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.done_event = threading.Event()
+        # Set by JobQueue.forget before the job finished: discard its result
+        self.forgotten = False
+        self.nbytes = 0
+        # Spans the job records show up in the submitter's timing recorder
+        self.recorder = timing.current_recorder()
+
+
+class JobQueue:
+    """Bounded, fair job queue served by a fixed set of worker threads
+
+    With ``processes=True`` each worker hands its job to a process pool, so
+    pure-Python work does not contend for the GIL; the callable and its
+    arguments must then be picklable.
+
+    Finished jobs are kept until they are forgotten, until their results
+    exceed ``max_finished_bytes`` in total (oldest dropped first) or for at
+    most ``finished_ttl`` seconds. A dropped job is unknown to ``status``
+    and ``result``, which raise KeyError.
+    """
+
+    def __init__(self, workers=None, max_pending=64, max_finished_bytes=1024 * 1024 * 1024,
+                 finished_ttl=600, processes=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.max_finished_bytes = max_finished_bytes
+        self.finished_ttl = finished_ttl
+        self._jobs = {}
+        self._finished = OrderedDict()
+        self._finished_bytes = 0
+        self._queues = OrderedDict()
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._process_pool = ProcessPoolExecutor(max_workers=self.workers) if processes else None
+        self._threads = []
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def finished_nbytes(self):
+        """Approximate bytes held by finished jobs not yet forgotten"""
+        return self._finished_bytes
+
+    @property
+    def pending(self):
+        """Number of jobs waiting for a worker"""
+        return self._pending
+
+    def submit(self, func, *args, owner=None, **kwargs):
+        """Queue func(*args, **kwargs) and return its job id"""
+        job = Job(owner, func, args, kwargs)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("JobQueue has been shut down")
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} jobs already pending")
+            self._jobs[job.id] = job
+            self._queues.setdefault(owner, deque()).append(job)
+            self._pending += 1
+            self._condition.notify()
+        return job.id
+
+    def status(self, job_id):
+        """Return the job's state: queued, running, done, failed or cancelled"""
+        return self._get(job_id).status
+
+    def result(self, job_id, timeout=None):
+        """Wait for a job and return its result, re-raising its exception"""
+        job = self._get(job_id)
+        if not job.done_event.wait(timeout):
+            raise TimeoutError(f"Job {job_id} did not finish within {timeout}s")
+        if job.status == CANCELLED:
+            raise CancelledJob(job_id)
+        if job.status == FAILED:
+            raise job.error
+        return job.result
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started yet; return True if cancelled"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return False
+            self._queues[job.owner].remove(job)
+            if not self._queues[job.owner]:
+                del self._queues[job.owner]
+            self._pending -= 1
+            self._finish(job, CANCELLED)
+            return True
+
+    def cancel_owner(self, owner):
+        """Cancel every queued job belonging to owner"""
+        with self._condition:
+            queued = list(self._queues.get(owner, ()))
+        return sum(self.cancel(job.id) for job in queued)
+
+    def forget(self, job_id):
+        """Drop a job's record and result
+
+        A job that is still queued or running is marked instead, and its
+        result is discarded as soon as it finishes.
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job.status in FINISHED_STATES:
+                del self._jobs[job_id]
+                if self._finished.pop(job_id, None) is not None:
+                    self._finished_bytes -= job.nbytes
+            else:
+                job.forgotten = True
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs, cancel queued ones and stop the workers"""
+        with self._condition:
+            self._closed = True
+            for queue in self._queues.values():
+                for job in queue:
+                    self._finish(job, CANCELLED)
+            self._queues.clear()
+            self._pending = 0
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait)
+
+    def _get(self, job_id):
+        try:
+            return self._jobs[job_id]
+        except KeyError:
+            raise KeyError(f"Unknown job: {job_id}") from None
+
+    def _next_job(self):
+        # Round-robin across owners: serve the first owner, then move it to the back
+        owner, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        if queue:
+            self._queues.move_to_end(owner)
+        else:
+            del self._queues[owner]
+        self._pending -= 1
+        return job
+
+    def _finish(self, job, status, result=None, error=None):
+        job.recorder = None
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.monotonic()
+        job.func = job.args = job.kwargs = None
+        if job.forgotten:
+            # Nobody will collect it, so don't keep the result around
+            job.result = job.error = None
+            self._jobs.pop(job.id, None)
+            job.done_event.set()
+            return
+        job.nbytes = result_nbytes(result)
+        self._finished[job.id] = job
+        self._finished_bytes += job.nbytes
+        # Bound the memory held by results nobody collected
+        expired = job.finished_at - self.finished_ttl
+        while self._finished:
+            old = next(iter(self._finished.values()))
+            if old is job or (self._finished_bytes <= self.max_finished_bytes and old.finished_at > expired):
+                break
+            del self._finished[old.id]
+            self._finished_bytes -= old.nbytes
+            self._jobs.pop(old.id, None)
+        job.done_event.set()
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._queues and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                job = self._next_job()
+                job.status = RUNNING
+                job.started_at = time.monotonic()
+                func, args, kwargs = job.func, job.args, job.kwargs
+
+            try:
+                with timing.use_recorder(job.recorder), timing.span('job', queued_ms=round((job.started_at - job.submitted_at) * 1000, 3)):
+                    if self._process_pool is not None:
+                        result = self._process_pool.submit(func, *args, **kwargs).result()
+                    else:
+                        result = func(*args, **kwargs)
+            except BaseException as exc:
+                with self._condition:
+                    self._finish(job, FAILED, error=exc)
+            else:
+                with self._condition:
+                    self._finish(job, DONE, result=result)
+            finally:
+                # Workers live as long as the process; don't let them pin a job's buffers
+                release_scratch()
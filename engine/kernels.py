@@ -0,0 +1,57 @@
+"""Built-in convolution kernels and their descriptions"""
+import numpy as np
+
+# Define convolution kernels
+KERNELS = {
+    'blur': {
+        'matrix': np.ones((3, 3), dtype=np.float32) / 9,
+        'name': 'Blur (Averaging)',
+        'explanation': """
+        **How it works:** The blur filter uses a 3×3 averaging kernel where each element is 1/9. 
+        This means each pixel in the output is the average of its 8 neighbors plus itself.
+        
+        **Effect:** Creates a smoothing effect by reducing sharp transitions between pixels, 
+        useful for noise reduction and creating a softer appearance.
+        
+        **Formula:** New_Pixel = (Sum of 9 neighboring pixels) / 9
+        """,
+        'icon': '🌫️'
+    },
+    'sharpen': {
+        'matrix': np.array([
+            [-1, -1, -1],
+            [-1, 9, -1],
+            [-1, -1, -1]
+        ], dtype=np.float32),
+        'name': 'Sharpen',
+        'explanation': """
+        **How it works:** The sharpen kernel strongly emphasizes the center pixel (value: 9) while 
+        subtracting all 8 neighboring pixels (-1 each). This amplifies differences between the center 
+        pixel and its surroundings, creating a strong sharpening effect.
+        
+        **Effect:** Enhances edges and fine details significantly, making the image appear much crisper and more defined.
+        
+        **Formula:** New_Pixel = 9×Center - Sum(All 8 Neighbors)
+        """,
+        'icon': '✨'
+    },
+    'edge': {
+        'matrix': np.array([
+            [-1, -1, -1],
+            [-1, 8, -1],
+            [-1, -1, -1]
+        ], dtype=np.float32),
+        'name': 'Edge Detection (Laplacian)',
+        'explanation': """
+        **How it works:** The Laplacian kernel strongly emphasizes the center pixel (value: 8) 
+        while subtracting all 8 neighbors (-1 each). This highlights areas where pixel intensity 
+        changes rapidly.
+        
+        **Effect:** Detects edges and boundaries by finding regions of high intensity change, 
+        making edges appear bright against a dark background.
+        
+        **Formula:** New_Pixel = 8×Center - (Sum of 8 neighbors)
+        """,
+        'icon': '🔍'
+    }
+}
@@ -0,0 +1,66 @@
+"""Output normalisation: mapping filter responses to uint8 pixels
+
+``clip`` saturates responses to [0, 255] (OpenCV's default for uint8), which
+drops every negative response. ``abs`` keeps the magnitude of negative
+responses, and ``minmax`` linearly stretches the full response range of the
+image to [0, 255]. Both of the latter read a signed int16/float32
+accumulator and write the uint8 result in a single OpenCV pass.
+"""
+import cv2
+import numpy as np
+
+CLIP = 'clip'
+ABS = 'abs'
+MINMAX = 'minmax'
+
+OUTPUT_MODES = {
+    CLIP: 'Clip to [0, 255]',
+    ABS: 'Absolute value',
+    MINMAX: 'Min-max normalise',
+}
+
+
+def check_output_mode(output):
+    """Raise ValueError for an unknown output mode"""
+    if output not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output}")
+
+
+def response_range(acc):
+    """Return the (min, max) response of an accumulator over all channels"""
+    return float(acc.min()), float(acc.max())
+
+
+def merge_ranges(ranges):
+    """Combine per-strip (min, max) pairs into one range"""
+    ranges = list(ranges)
+    return min(lo for lo, _ in ranges), max(hi for _, hi in ranges)
+
+
+def saturate_uint8(values, dst=None):
+    """Round a float array to nearest (ties to even) and saturate to uint8
+
+    Works in place on ``values``; the cast is written into ``dst`` when given.
+    """
+    np.clip(values, 0, 255, out=values)
+    np.rint(values, out=values)
+    if dst is None:
+        return values.astype(np.uint8)
+    np.copyto(dst, values, casting='unsafe')
+    return dst
+
+
+def to_uint8(acc, output, value_range=None, dst=None):
+    """Map a signed accumulator to uint8 using the ABS or MINMAX mode
+
+    For MINMAX, ``value_range`` is the global (min, max) response; it
+    defaults to the accumulator's own range, which is only correct when
+    ``acc`` covers the whole image.
+    """
+    if output == ABS:
+        return cv2.convertScaleAbs(acc, dst=dst)
+
+    lo, hi = value_range if value_range is not None else response_range(acc)
+    alpha = 255.0 / (hi - lo) if hi > lo else 0.0
+    # After the shift every value is >= 0, so the absolute value is a no-op
+    return cv2.convertScaleAbs(acc, dst=dst, alpha=alpha, beta=-lo * alpha)
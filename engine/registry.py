@@ -0,0 +1,176 @@
+"""Compiled-kernel registry: validate and analyse each kernel once
+
+A compiled kernel is a dict holding the canonical float32, C-contiguous,
+read-only matrix together with everything the engine would otherwise
+recompute per call: sum, rank, separability and the execution plan (and
+hence backend) chosen by ``engine.decompose.analyse_kernel``. Entries are
+content-addressed, so every session using the same custom kernel shares
+one entry. Passing an entry's own ``matrix`` back in is an identity
+lookup that skips hashing the kernel bytes.
+
+Custom kernels arrive as editor text, JSON or .npy files; the parsers here
+turn them into matrices and ``validate_kernel`` rejects anything the
+filters cannot run with a ValueError that can be shown to the user.
+"""
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from fractions import Fraction
+
+import numpy as np
+
+# Largest accepted kernel side; anything above the FFT crossover still runs fast
+MAX_KERNEL_SIZE = 101
+
+# Relative singular value below which a component counts as zero
+RANK_TOLERANCE = 1e-6
+
+
+def validate_kernel(matrix, max_size=MAX_KERNEL_SIZE):
+    """Return matrix as a float32 C-contiguous 2-D array, or raise ValueError
+
+    ``max_size`` bounds user-supplied kernels; pass None for no limit.
+    """
+    try:
+        kernel = np.array(matrix, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise ValueError("Kernel must be a rectangular grid of numbers") from None
+    if kernel.ndim != 2 or kernel.size == 0:
+        raise ValueError(f"Kernel must be a non-empty 2-D matrix, got shape {kernel.shape}")
+    if max_size is not None and max(kernel.shape) > max_size:
+        raise ValueError(f"Kernel sides are limited to {max_size}, got {kernel.shape[0]}×{kernel.shape[1]}")
+    if not np.all(np.isfinite(kernel)):
+        raise ValueError("Kernel values must be finite numbers")
+    return np.ascontiguousarray(kernel)
+
+
+def normalize_kernel(kernel):
+    """Scale a kernel so its taps sum to 1; kernels summing to 0 are returned unchanged"""
+    kernel = validate_kernel(kernel)
+    total = float(kernel.sum(dtype=np.float64))
+    if abs(total) <= RANK_TOLERANCE * max(1.0, float(np.abs(kernel).sum())):
+        return kernel
+    return np.ascontiguousarray(kernel / np.float32(total))
+
+
+def parse_kernel_text(text):
+    """Parse editor text: one row per line (or ';'), values split by commas or spaces
+
+    Values may be fractions such as ``1/9``.
+    """
+    rows = []
+    for line in text.replace(';', '\n').splitlines():
+        line = line.strip().strip('[],')
+        if not line:
+            continue
+        try:
+            rows.append([float(Fraction(token)) for token in line.replace(',', ' ').split()])
+        except (ValueError, ZeroDivisionError):
+            raise ValueError(f"Cannot read kernel row: {line!r}") from None
+    if not rows:
+        raise ValueError("Kernel is empty")
+    if len({len(row) for row in rows}) != 1:
+        raise ValueError("Every kernel row must have the same number of values")
+    return validate_kernel(rows)
+
+
+def load_kernel_file(data, filename):
+    """Read a kernel from .json or .npy file bytes; return (matrix, name or None)
+
+    JSON may be a list of rows or an object with ``matrix`` and an optional
+    ``name``. .npy files are loaded without pickle support.
+    """
+    if filename.lower().endswith('.npy'):
+        try:
+            matrix = np.load(io.BytesIO(data), allow_pickle=False)
+        except (OSError, ValueError):
+            raise ValueError(f"{filename} is not a readable .npy array") from None
+        return validate_kernel(matrix), None
+
+    try:
+        content = json.loads(data)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError(f"{filename} is not valid JSON") from None
+    name = None
+    if isinstance(content, dict):
+        name = content.get('name')
+        content = content.get('matrix')
+        if content is None:
+            raise ValueError(f"{filename} has no 'matrix' entry")
+    return validate_kernel(content), str(name) if name is not None else None
+
+
+def kernel_digest(kernel):
+    """Content hash of a canonical kernel, stable across processes"""
+    h = hashlib.sha256(str(kernel.shape).encode())
+    h.update(kernel.tobytes())
+    return h.hexdigest()
+
+
+def kernel_rank(kernel):
+    """Numerical rank of a kernel from its singular values"""
+    s = np.linalg.svd(kernel.astype(np.float64), compute_uv=False)
+    if s[0] == 0:
+        return 0
+    return int(np.sum(s > RANK_TOLERANCE * s[0]))
+
+
+class KernelRegistry:
+    """Bounded LRU of compiled kernels, safe to share between threads
+
+    ``analyse`` maps a canonical kernel to its execution plan (normally
+    ``engine.decompose.analyse_kernel``).
+    """
+
+    def __init__(self, analyse, max_entries=256):
+        self.analyse = analyse
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def compile(self, kernel):
+        """Return the compiled entry for a kernel, analysing it on first use"""
+        entry = self._by_id.get(id(kernel))
+        if entry is not None and entry['matrix'] is kernel:
+            return entry
+
+        kernel = np.asarray(kernel)
+        # Raw bytes as the key: repeat calls avoid the float32 copy and the hash
+        key = (kernel.shape, kernel.dtype.str, kernel.tobytes())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        entry = self._build(kernel)
+        with self._lock:
+            self._entries[key] = entry
+            self._by_id[id(entry['matrix'])] = entry
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._by_id.pop(id(evicted['matrix']), None)
+        return entry
+
+    def _build(self, kernel):
+        matrix = validate_kernel(kernel, max_size=None)
+        matrix.setflags(write=False)
+        plan = self.analyse(matrix)
+        rank = kernel_rank(matrix)
+        return {
+            'digest': kernel_digest(matrix),
+            'matrix': matrix,
+            'shape': matrix.shape,
+            'sum': float(matrix.sum(dtype=np.float64)),
+            'rank': rank,
+            'separable': rank <= 1,
+            'backend': plan['method'],
+            'plan': plan,
+        }
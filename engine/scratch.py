@@ -0,0 +1,45 @@
+"""Per-thread scratch buffers reused across filter calls
+
+Large NumPy allocations are served by fresh mmap'd pages that the kernel
+has to fault in and zero on first touch, so allocating a new accumulator
+or output for every call costs real time as well as memory. ``scratch``
+hands out uninitialised arrays backed by a buffer kept per thread and per
+name, growing it only when a bigger array is requested.
+
+An array returned by ``scratch`` is valid until the next request for the
+same name on the same thread, so results must be consumed (or copied)
+before filtering again.
+
+Long-lived threads call ``release_scratch`` when a unit of work ends
+(JobQueue after every job, the HTTP service after every request), so a
+buffer is reused within a job but not pinned by an idle worker.
+"""
+import threading
+
+import numpy as np
+
+# Larger requests are allocated fresh rather than kept in a thread's buffers
+MAX_SCRATCH_BYTES = 64 * 1024 * 1024
+
+_local = threading.local()
+
+
+def scratch(name, shape, dtype=np.uint8):
+    """Return an uninitialised array of shape and dtype from the named buffer"""
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    if nbytes > MAX_SCRATCH_BYTES:
+        return np.empty(shape, dtype)
+
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buffer = buffers.get(name)
+    if buffer is None or buffer.nbytes < nbytes:
+        buffer = buffers[name] = np.empty(nbytes, np.uint8)
+    return buffer[:nbytes].view(dtype).reshape(shape)
+
+
+def release_scratch():
+    """Free the calling thread's scratch buffers"""
+    _local.buffers = {}
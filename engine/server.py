@@ -0,0 +1,449 @@
+"""Minimal asyncio HTTP service exposing the convolution engine
+
+Run with ``python -m engine.server`` and POST image bytes to ``/convolve``::
+
+    curl --data-binary @photo.jpg 'http://127.0.0.1:8600/convolve?kernel=blur' -o blur.png
+    curl --data-binary @photo.jpg \\
+        'http://127.0.0.1:8600/convolve?matrix=[[0,-1,0],[-1,5,-1],[0,-1,0]]&format=jpeg' -o out.jpg
+
+Query parameters: ``kernel`` (a KERNELS key) or ``matrix`` (a JSON list of
+rows, at most 101 per side), ``output`` (clip/abs/minmax), ``format``
+(png/jpeg/webp), ``quality`` and ``compress_level``. ``GET /metrics`` returns per-stage timings in the
+Prometheus text format (see engine.timing). Request bodies may be sent with Content-Length or
+chunked transfer encoding; image responses are always streamed chunked.
+At most ``max_concurrency`` requests are filtered at once, up to
+``max_waiting`` more wait for a slot, and anything beyond that gets 503.
+Request and header lines may be up to MAX_LINE_BYTES (512 KiB), enough for
+any URL-encoded 101x101 matrix; longer ones get 414 or 431.
+
+``python -m engine.server --bench IMAGE`` starts a server in-process and
+reports sustained requests per second for one filter.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from .cache import ResultCache, cached_convolution, image_digest
+from . import timing
+from .encoding import OUTPUT_FORMATS, encode_image
+from .kernels import KERNELS
+from .output import CLIP, OUTPUT_MODES
+from .registry import validate_kernel
+from .scratch import release_scratch
+from .tiling import normalize_mode
+
+DEFAULT_PORT = 8600
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_HEADER_COUNT = 100
+# Longest request or header line; a URL-encoded 101x101 matrix at full float precision fits
+MAX_LINE_BYTES = 512 * 1024
+RESPONSE_CHUNK_BYTES = 64 * 1024
+# How long a rejected client may keep sending before the connection is closed
+LINGER_SECONDS = 1.0
+
+logger = logging.getLogger('picupg.server')
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    414: 'URI Too Long',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HTTPError(Exception):
+    """An error that maps directly to an HTTP status code"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def parse_kernel(params):
+    """Return the kernel matrix named or given in the query parameters"""
+    if 'matrix' in params:
+        try:
+            return validate_kernel(json.loads(params['matrix']))
+        except json.JSONDecodeError:
+            raise HTTPError(400, "matrix must be a JSON list of numeric rows") from None
+        except ValueError as e:
+            raise HTTPError(400, str(e)) from None
+
+    name = params.get('kernel')
+    if name not in KERNELS:
+        raise HTTPError(400, f"kernel must be one of {', '.join(sorted(KERNELS))} (or pass matrix)")
+    return KERNELS[name]['matrix']
+
+
+def parse_options(params):
+    """Return output mode and encoding options from the query parameters"""
+    output = params.get('output', CLIP)
+    if output not in OUTPUT_MODES:
+        raise HTTPError(400, f"output must be one of {', '.join(OUTPUT_MODES)}")
+
+    format = params.get('format', 'png').upper()
+    if format not in OUTPUT_FORMATS:
+        raise HTTPError(400, f"format must be one of {', '.join(f.lower() for f in OUTPUT_FORMATS)}")
+
+    try:
+        quality = int(params.get('quality', 90))
+        compress_level = int(params.get('compress_level', 1))
+    except ValueError:
+        raise HTTPError(400, "quality and compress_level must be integers") from None
+    if not 1 <= quality <= 100 or not 0 <= compress_level <= 9:
+        raise HTTPError(400, "quality must be 1-100 and compress_level 0-9")
+
+    return output, {'format': format, 'quality': quality, 'compress_level': compress_level}
+
+
+def process_image(body, kernel, output, encoding, cache=None):
+    """Decode, filter and re-encode an image; runs on a worker thread"""
+    try:
+        with Image.open(io.BytesIO(body)) as image:
+            with timing.span('decode'):
+                image.load()
+                # Palette, 1-bit, 16-bit and CMYK images become L/RGB/RGBA pixels
+                image = normalize_mode(image)
+            result = cached_convolution(image, kernel, image_digest(body), cache, output=output)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        raise HTTPError(400, f"could not decode image: {exc}") from None
+    finally:
+        # Executor threads outlive the request, so don't keep its buffers
+        release_scratch()
+    return encode_image(result, **encoding)
+
+
+async def read_headers(reader):
+    """Read an HTTP request or status line and its headers"""
+    try:
+        start_line = await reader.readline()
+    except ValueError:
+        # The StreamReader's line limit (MAX_LINE_BYTES in the server) was exceeded
+        raise HTTPError(414, "request line too long") from None
+    if not start_line:
+        return None, {}
+    headers = {}
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError:
+            raise HTTPError(431, "header line too long") from None
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADER_COUNT:
+            raise HTTPError(400, "too many headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return start_line.decode('latin-1').strip(), headers
+
+
+async def read_body(reader, headers, max_bytes):
+    """Read a Content-Length or chunked body, enforcing max_bytes as it streams"""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            try:
+                size = int((await reader.readline()).split(b';')[0], 16)
+            except ValueError:
+                raise HTTPError(400, "malformed chunk size") from None
+            if size == 0:
+                # Skip optional trailers up to the final blank line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return bytes(body)
+            if len(body) + size > max_bytes:
+                raise HTTPError(413, f"body exceeds {max_bytes} bytes")
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+
+    if 'content-length' not in headers:
+        raise HTTPError(411, "Content-Length or chunked body required")
+    try:
+        length = int(headers['content-length'])
+    except ValueError:
+        raise HTTPError(400, "invalid Content-Length") from None
+    if length > max_bytes:
+        raise HTTPError(413, f"body exceeds {max_bytes} bytes")
+    return await reader.readexactly(length)
+
+
+async def write_response(writer, status, body, content_type, keep_alive=True):
+    """Write a complete response with a Content-Length"""
+    head = (
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+async def write_chunked(writer, data, content_type, keep_alive=True):
+    """Stream data as a chunked 200 response, draining after every chunk"""
+    head = (
+        "HTTP/1.1 200 OK\r\n"
+        f"Content-Type: {content_type}\r\n"
+        "Transfer-Encoding: chunked\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1'))
+    view = memoryview(data)
+    for start in range(0, len(view), RESPONSE_CHUNK_BYTES):
+        chunk = view[start:start + RESPONSE_CHUNK_BYTES]
+        writer.write(f"{len(chunk):x}\r\n".encode('latin-1'))
+        writer.write(chunk)
+        writer.write(b'\r\n')
+        await writer.drain()
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+async def linger(reader, writer, timeout=LINGER_SECONDS):
+    """Half-close and discard what the client is still sending
+
+    Closing a socket with unread input resets the connection, and the
+    client may then never see the error response written just before.
+    """
+    if writer.can_write_eof():
+        writer.write_eof()
+    async def discard():
+        while await reader.read(RESPONSE_CHUNK_BYTES):
+            pass
+
+    try:
+        await asyncio.wait_for(discard(), timeout)
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+
+
+class ConvolutionServer:
+    """HTTP front end for the engine with a bounded number of active filters"""
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, max_concurrency=4,
+                 max_waiting=16, max_body_bytes=MAX_BODY_BYTES, cache=None):
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.max_body_bytes = max_body_bytes
+        self.cache = cache
+        self.requests = 0
+        self._waiting = 0
+        self._semaphore = None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='http-convolution')
+        self._server = None
+
+    async def start(self):
+        """Start listening; returns once the socket is bound"""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port, limit=MAX_LINE_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """Start the server if needed and serve until cancelled"""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """Stop accepting connections and release the worker threads"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False)
+
+    async def handle_connection(self, reader, writer):
+        """Serve keep-alive requests on one connection until it closes"""
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request_line, headers = await read_headers(reader)
+                    if request_line is None:
+                        break
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    await self.handle_request(request_line, headers, reader, writer, keep_alive)
+                except HTTPError as exc:
+                    # The rest of a rejected body is unread, so the connection can't be reused
+                    keep_alive = False
+                    message = json.dumps({'error': exc.message}).encode()
+                    await write_response(writer, exc.status, message, 'application/json', keep_alive=False)
+                    await linger(reader, writer)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    raise
+                except Exception:
+                    # A bug in the filter pipeline must still answer the client
+                    logger.exception("request failed")
+                    keep_alive = False
+                    message = json.dumps({'error': 'internal server error'}).encode()
+                    await write_response(writer, 500, message, 'application/json', keep_alive=False)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, request_line, headers, reader, writer, keep_alive):
+        """Route one request"""
+        try:
+            method, target, _ = request_line.split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "malformed request line") from None
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/health':
+            if method != 'GET':
+                raise HTTPError(405, "use GET")
+            status = {'status': 'ok', 'kernels': sorted(KERNELS), 'requests': self.requests}
+            await write_response(writer, 200, json.dumps(status).encode(), 'application/json', keep_alive)
+            return
+        if url.path == '/metrics':
+            if method != 'GET':
+                raise HTTPError(405, "use GET")
+            body = timing.prometheus_text().encode()
+            await write_response(writer, 200, body, 'text/plain; version=0.0.4', keep_alive)
+            return
+        if url.path != '/convolve':
+            raise HTTPError(404, f"no route for {url.path}")
+        if method != 'POST':
+            raise HTTPError(405, "use POST")
+
+        kernel = parse_kernel(params)
+        output, encoding = parse_options(params)
+        body = await read_body(reader, headers, self.max_body_bytes)
+
+        if self._semaphore.locked() and self._waiting >= self.max_waiting:
+            raise HTTPError(503, "too many requests in progress, retry later")
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(
+                self._executor, process_image, body, kernel, output, encoding, self.cache
+            )
+        finally:
+            self._semaphore.release()
+        self.requests += 1
+        await write_chunked(writer, data, OUTPUT_FORMATS[encoding['format']]['mime'], keep_alive)
+
+
+async def read_response(reader):
+    """Read one response from the service; returns (status, body)"""
+    status_line, headers = await read_headers(reader)
+    if status_line is None:
+        raise ConnectionError("connection closed by server")
+    status = int(status_line.split(' ', 2)[1])
+    body = await read_body(reader, headers, float('inf'))
+    return status, body
+
+
+async def run_benchmark(image_path, kernel='blur', requests=200, concurrency=8, max_concurrency=4):
+    """Serve in-process and return (requests per second, failures) for one filter"""
+    server = ConvolutionServer(port=0, max_concurrency=max_concurrency, max_waiting=concurrency)
+    await server.start()
+    body = open(image_path, 'rb').read()
+    request = (
+        f"POST /convolve?kernel={kernel} HTTP/1.1\r\n"
+        f"Host: {server.host}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode('latin-1') + body
+    remaining = [requests]
+    failures = [0]
+
+    async def client():
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            writer.write(request)
+            await writer.drain()
+            status, _ = await read_response(reader)
+            if status != 200:
+                failures[0] += 1
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await server.close()
+    return requests / elapsed, failures[0]
+
+
+def build_parser():
+    """Build the argument parser for the HTTP service"""
+    parser = argparse.ArgumentParser(
+        prog='python -m engine.server',
+        description='Serve the convolution engine over HTTP',
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to bind (default: {DEFAULT_PORT})')
+    parser.add_argument(
+        '--max-concurrency', type=int, default=4, metavar='N',
+        help='Filter at most N requests at once (default: 4)',
+    )
+    parser.add_argument(
+        '--max-waiting', type=int, default=16, metavar='N',
+        help='Queue up to N more requests before answering 503 (default: 16)',
+    )
+    parser.add_argument(
+        '--max-body-mb', type=int, default=MAX_BODY_BYTES // (1024 * 1024), metavar='MB',
+        help='Reject request bodies larger than MB megabytes (default: 64)',
+    )
+    parser.add_argument(
+        '--cache-mb', type=int, default=256, metavar='MB',
+        help='Result cache size in megabytes, 0 to disable (default: 256)',
+    )
+    parser.add_argument('--bench', metavar='IMAGE', help='Measure requests per second against IMAGE and exit')
+    parser.add_argument('--bench-kernel', default='blur', choices=sorted(KERNELS), help='Filter to benchmark')
+    parser.add_argument('--bench-requests', type=int, default=200, metavar='N', help='Requests to send')
+    parser.add_argument('--bench-clients', type=int, default=8, metavar='N', help='Concurrent keep-alive clients')
+    return parser
+
+
+def main(argv=None):
+    """Run the HTTP service (or its benchmark) and return a process exit code"""
+    args = build_parser().parse_args(argv)
+
+    if args.bench:
+        rps, failures = asyncio.run(run_benchmark(
+            args.bench, kernel=args.bench_kernel, requests=args.bench_requests,
+            concurrency=args.bench_clients, max_concurrency=args.max_concurrency,
+        ))
+        print(f"{args.bench_requests} requests, {failures} failed: {rps:.1f} requests/s")
+        return 1 if failures else 0
+
+    timing.enable()
+    cache = ResultCache(max_bytes=args.cache_mb * 1024 * 1024) if args.cache_mb else None
+    server = ConvolutionServer(
+        host=args.host, port=args.port, max_concurrency=args.max_concurrency,
+        max_waiting=args.max_waiting, max_body_bytes=args.max_body_mb * 1024 * 1024, cache=cache,
+    )
+    print(f"Serving convolution API on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Memory-mapped .npy files for decoded uploads and filter results
+
+Arrays written here are read back with ``mmap_mode='r'``, so their pages
+live in the OS page cache rather than on the Python heap: the kernel can
+drop them under memory pressure and re-read them on demand, which lets
+one worker filter images larger than RAM. Files are named by content (an
+image digest or ``result_key``) and published with an atomic rename, so
+several worker processes sharing a spill directory decode each upload
+once and map the same pages.
+"""
+import os
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from .output import CLIP
+from .tiling import DEFAULT_STRIP_ROWS, convolve_parallel, convolve_tiled, iter_strips, read_rows, source_shape, to_rgb
+
+
+def spill_path(spill_dir, name):
+    """Return the .npy path for name under spill_dir"""
+    return Path(spill_dir) / f"{name}.npy"
+
+
+def open_spilled(path):
+    """Map an existing .npy file read-only, or return None if it is missing"""
+    try:
+        return np.load(path, mmap_mode='r')
+    except FileNotFoundError:
+        return None
+
+
+def _write_spill(path, shape, fill):
+    """Create path through a temporary memory map filled by fill(dst); return it read-only"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+    dst = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=shape)
+    try:
+        fill(dst)
+        dst.flush()
+    except BaseException:
+        del dst
+        tmp_path.unlink(missing_ok=True)
+        raise
+    del dst
+    # Another process may have published the same content meanwhile; either copy is fine
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r')
+
+
+def spill_rgb(src, path, strip_rows=DEFAULT_STRIP_ROWS):
+    """Write a PIL image or array as an RGB .npy strip by strip and map it
+
+    Returns the existing file's map when path is already present.
+    """
+    mapped = open_spilled(path)
+    if mapped is not None:
+        return mapped
+    height, width = source_shape(src)
+
+    def fill(dst):
+        for start, stop in iter_strips(height, strip_rows):
+            dst[start:stop] = to_rgb(read_rows(src, start, stop))
+
+    return _write_spill(path, (height, width, 3), fill)
+
+
+def spill_gray(rgb, path, strip_rows=DEFAULT_STRIP_ROWS):
+    """Write the grayscale plane of an RGB array as .npy strip by strip and map it"""
+    mapped = open_spilled(path)
+    if mapped is not None:
+        return mapped
+    height, width = rgb.shape[:2]
+
+    def fill(dst):
+        for start, stop in iter_strips(height, strip_rows):
+            cv2.cvtColor(np.ascontiguousarray(rgb[start:stop]), cv2.COLOR_RGB2GRAY, dst=dst[start:stop])
+
+    return _write_spill(path, (height, width), fill)
+
+
+def spill_convolution(src, kernel, path, strip_rows=DEFAULT_STRIP_ROWS, workers=None, output=CLIP):
+    """Convolve src straight into a mapped .npy result at path and map it read-only
+
+    ``src`` may itself be a map from ``spill_rgb``, so neither the input
+    nor the output has to fit in RAM. An existing result is reused.
+    """
+    mapped = open_spilled(path)
+    if mapped is not None:
+        return mapped
+    height, width = source_shape(src)
+
+    def fill(dst):
+        if workers and workers > 1:
+            convolve_parallel(src, kernel, dst=dst, workers=workers, strip_rows=strip_rows, output=output)
+        else:
+            convolve_tiled(src, kernel, dst=dst, strip_rows=strip_rows, output=output)
+
+    return _write_spill(path, (height, width, 3), fill)
+
+
+def prune_spill_dir(spill_dir, max_bytes):
+    """Delete the least recently written .npy files until spill_dir fits max_bytes
+
+    Processes that still map a deleted file keep their pages until they
+    drop the map (POSIX unlink semantics).
+    """
+    spill_dir = Path(spill_dir)
+    if not spill_dir.is_dir():
+        return
+    files = []
+    for path in spill_dir.rglob('*.npy'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            # Still mapped on platforms that forbid deleting open files
+            continue
+        total -= size
@@ -0,0 +1,111 @@
+"""Shared, byte-budgeted store for uploaded images
+
+Identical uploads from different sessions share one DerivedImage, keyed by
+``image_digest``. Each entry keeps the encoded upload bytes, which are
+compact, plus whatever planes have been decoded from them. When the store
+goes over budget it first drops the decoded planes of the least recently
+used entries (they are decoded again on demand) and removes entries no
+session references any more. With ``spill_dir`` decoded planes are
+memory-mapped files instead (see engine.spill); they do not count against
+``max_bytes`` and the directory is pruned to ``max_spill_bytes`` each time
+an upload is acquired (walking it on every touch would cost a directory
+scan per rerun).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from .cache import image_digest
+from .derived import DerivedImage
+from .spill import prune_spill_dir
+
+# Sessions that have not touched the store for this long no longer pin entries
+DEFAULT_OWNER_TTL = 3600
+
+
+class ImageStore:
+    """Deduplicated upload store with per-owner references and LRU eviction"""
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, owner_ttl=DEFAULT_OWNER_TTL,
+                 spill_dir=None, max_spill_bytes=4 * 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.owner_ttl = owner_ttl
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self._entries = OrderedDict()
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        """Encoded plus decoded bytes currently held"""
+        return sum(derived.encoded_nbytes + derived.nbytes for derived in self._entries.values())
+
+    def acquire(self, data, owner):
+        """Return (digest, DerivedImage) for upload bytes, referenced by owner
+
+        An owner references one upload at a time; acquiring a new one
+        releases its previous reference.
+        """
+        digest = image_digest(data)
+        with self._lock:
+            derived = self._entries.get(digest)
+            if derived is None:
+                derived = DerivedImage(data, spill_dir=self.spill_dir)
+                self._entries[digest] = derived
+            self._entries.move_to_end(digest)
+            self._owners[owner] = (digest, time.monotonic())
+        self.trim()
+        if self.spill_dir is not None:
+            prune_spill_dir(self.spill_dir, self.max_spill_bytes)
+        return digest, derived
+
+    def touch(self, owner):
+        """Mark owner's upload as recently used and re-apply the budget
+
+        Planes are decoded lazily, so call this after work that may have
+        decoded some. Returns False when owner holds no reference any more
+        (it was released, or idle longer than ``owner_ttl``); the caller
+        should ``acquire`` its upload again rather than keep using an
+        image the store no longer accounts for.
+        """
+        with self._lock:
+            known = owner in self._owners
+            if known:
+                digest, _ = self._owners[owner]
+                self._owners[owner] = (digest, time.monotonic())
+                if digest in self._entries:
+                    self._entries.move_to_end(digest)
+        self.trim()
+        return known
+
+    def release(self, owner):
+        """Drop owner's reference, freeing its upload if no one else uses it"""
+        with self._lock:
+            self._owners.pop(owner, None)
+        self.trim()
+
+    def trim(self):
+        """Evict until the store fits its budget"""
+        with self._lock:
+            now = time.monotonic()
+            for owner, (_, touched) in list(self._owners.items()):
+                if now - touched > self.owner_ttl:
+                    del self._owners[owner]
+            referenced = {digest for digest, _ in self._owners.values()}
+
+            # Unreferenced uploads are removed outright
+            for digest in list(self._entries):
+                if digest not in referenced:
+                    del self._entries[digest]
+
+            # Referenced ones keep their bytes but give up decoded planes, oldest first
+            # (except the most recently used, which is the one being viewed)
+            total = self.nbytes
+            for derived in list(self._entries.values())[:-1]:
+                if total <= self.max_bytes:
+                    break
+                total -= derived.release()
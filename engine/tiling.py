@@ -0,0 +1,198 @@
+"""Strip-by-strip convolution with bounded memory
+
+Each strip is read together with a halo of the rows the kernel needs above
+and below it, converted to RGB, filtered, and its interior rows written
+straight into the output. Rows at the true image edges get OpenCV's
+default reflected border, so the result is bit-identical to filtering the
+whole image at once. (Above roughly 11×11 both OpenCV's internal DFT and
+the engine.fft backend round in a way that depends on the block size;
+there results may differ by one intensity level.)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .decompose import block_response_range, filter_block
+from .output import CLIP, MINMAX, check_output_mode, merge_ranges
+from .scratch import scratch
+
+DEFAULT_STRIP_ROWS = 256
+
+
+def kernel_halo(kernel):
+    """Return the rows needed (above, below) each output row for a kernel"""
+    kernel_rows = kernel.shape[0]
+    anchor = kernel_rows // 2
+    return anchor, kernel_rows - 1 - anchor
+
+
+def iter_strips(height, strip_rows):
+    """Yield (start, stop) row ranges covering an image of the given height"""
+    for start in range(0, height, strip_rows):
+        yield start, min(start + strip_rows, height)
+
+
+def source_shape(src):
+    """Return (height, width) of a PIL image or array-like source"""
+    if isinstance(src, Image.Image):
+        return src.size[1], src.size[0]
+    return src.shape[0], src.shape[1]
+
+
+def normalize_mode(image):
+    """Return a PIL image whose pixels are L, RGB or RGBA uint8
+
+    Other modes would reach the filters as palette indices (P), booleans
+    (1), 16-bit values (I;16), 32-bit integers (I), two channels (LA) or
+    inverted ink (CMYK). 16-bit grayscale is scaled down to L, 32-bit
+    grayscale is clipped to 0-255 (it usually holds 8-bit values, and a
+    fixed mapping keeps strips of one image consistent), and everything
+    else goes through Pillow's own RGB conversion.
+    """
+    if image.mode in ('L', 'RGB', 'RGBA'):
+        return image
+    if image.mode in ('I;16', 'I;16L', 'I;16B', 'I;16N'):
+        # 16-bit samples: keep the high byte, as an 8-bit display would
+        return Image.fromarray((np.asarray(image).astype(np.uint32) >> 8).astype(np.uint8))
+    if image.mode == 'I':
+        # Pillow's I to L conversion clips, so negative values become 0
+        return image.convert('L')
+    return image.convert('RGB')
+
+
+def read_rows(src, start, stop):
+    """Read rows [start, stop) of a PIL image or array-like source as an array"""
+    if isinstance(src, Image.Image):
+        return np.asarray(normalize_mode(src.crop((0, start, src.size[0], stop))))
+    return np.asarray(src[start:stop])
+
+
+def to_rgb(block, dst=None):
+    """Convert a grayscale, RGB or RGBA uint8 block to 3-channel RGB
+
+    RGB input is returned as-is (no copy); conversions are written into
+    ``dst`` when given.
+    """
+    if block.ndim == 2:
+        return cv2.cvtColor(block, cv2.COLOR_GRAY2RGB, dst=dst)
+    if block.shape[2] == 4:
+        return cv2.cvtColor(block, cv2.COLOR_RGBA2RGB, dst=dst)
+    return block
+
+
+def read_strip(src, start, stop, above, below):
+    """Read output rows [start, stop) plus halo as RGB; return (block, offset)"""
+    height, _ = source_shape(src)
+    read_start = max(start - above, 0)
+    read_stop = min(stop + below, height)
+    rows = read_rows(src, read_start, read_stop)
+    if rows.ndim == 3 and rows.shape[2] == 3:
+        return rows, start - read_start
+    return to_rgb(rows, dst=scratch('strip_rgb', rows.shape[:2] + (3,))), start - read_start
+
+
+def convolve_strip(src, kernel, start, stop, dst, output=CLIP, value_range=None):
+    """Filter output rows [start, stop) of src into the same rows of dst"""
+    block, offset = read_strip(src, start, stop, *kernel_halo(kernel))
+    filtered = filter_block(block, kernel, output=output, value_range=value_range, dst=scratch('strip_output', block.shape))
+    dst[start:stop] = filtered[offset:offset + (stop - start)]
+
+
+def strip_response_range(src, kernel, start, stop):
+    """(min, max) signed filter response over output rows [start, stop)"""
+    block, offset = read_strip(src, start, stop, *kernel_halo(kernel))
+    return block_response_range(block, kernel, offset, offset + (stop - start))
+
+
+def convolve_tiled(src, kernel, dst=None, strip_rows=DEFAULT_STRIP_ROWS, output=CLIP):
+    """Convolve a PIL image or HxW(xC) uint8 array strip by strip
+
+    ``dst`` may be any writable HxWx3 uint8 array, including a memory map,
+    so neither the input nor the output has to fit in RAM. Peak extra
+    memory is a few strips regardless of image size. The ``minmax`` output
+    mode needs the global response range and so makes two passes.
+    """
+    check_output_mode(output)
+    height, width = source_shape(src)
+    above, below = kernel_halo(kernel)
+    # Strips must be at least as tall as the kernel for the border reflection to match
+    strip_rows = max(strip_rows, above + below + 1)
+
+    if dst is None:
+        dst = np.empty((height, width, 3), dtype=np.uint8)
+
+    strips = list(iter_strips(height, strip_rows))
+    value_range = None
+    if output == MINMAX:
+        value_range = merge_ranges(strip_response_range(src, kernel, start, stop) for start, stop in strips)
+
+    for start, stop in strips:
+        convolve_strip(src, kernel, start, stop, dst, output=output, value_range=value_range)
+    return dst
+
+
+def parallel_strip_rows(height, workers):
+    """Pick a strip height giving each worker several strips to balance load"""
+    return max(32, -(-height // (workers * 4)))
+
+
+def run_strips(pool, strips, func):
+    """Run func(start, stop) for every strip on pool, returning results in order"""
+    futures = [pool.submit(func, start, stop) for start, stop in strips]
+    # Surface the first worker exception, if any
+    return [future.result() for future in futures]
+
+
+def convolve_parallel(src, kernel, dst=None, workers=None, strip_rows=None, executor=None, output=CLIP):
+    """Convolve strips concurrently on a thread pool
+
+    OpenCV and NumPy release the GIL while filtering and copying, so strips
+    run in parallel on separate cores. Each strip writes a disjoint row
+    range of ``dst``, and the output is identical to ``convolve_tiled``.
+    Pass ``executor`` to reuse a long-lived pool instead of creating one.
+    """
+    check_output_mode(output)
+    if isinstance(src, Image.Image):
+        # Decode once up front; lazy PIL loading is not safe across threads
+        src.load()
+
+    height, width = source_shape(src)
+    workers = workers or os.cpu_count() or 1
+    above, below = kernel_halo(kernel)
+    strip_rows = max(strip_rows or parallel_strip_rows(height, workers), above + below + 1)
+
+    if dst is None:
+        dst = np.empty((height, width, 3), dtype=np.uint8)
+
+    strips = list(iter_strips(height, strip_rows))
+    pool = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix='convolve-strip')
+    try:
+        value_range = None
+        if output == MINMAX:
+            value_range = merge_ranges(run_strips(
+                pool, strips, lambda start, stop: strip_response_range(src, kernel, start, stop)
+            ))
+        run_strips(
+            pool, strips,
+            lambda start, stop: convolve_strip(src, kernel, start, stop, dst, output=output, value_range=value_range),
+        )
+    finally:
+        if executor is None:
+            pool.shutdown()
+    return dst
+
+
+def convolve_npy_file(src_path, dst_path, kernel, strip_rows=DEFAULT_STRIP_ROWS, workers=None, output=CLIP):
+    """Convolve a .npy image on disk into a new .npy file through memory maps"""
+    src = np.load(src_path, mmap_mode='r')
+    height, width = src.shape[:2]
+    dst = np.lib.format.open_memmap(dst_path, mode='w+', dtype=np.uint8, shape=(height, width, 3))
+    if workers and workers > 1:
+        convolve_parallel(src, kernel, dst=dst, workers=workers, strip_rows=strip_rows, output=output)
+    else:
+        convolve_tiled(src, kernel, dst=dst, strip_rows=strip_rows, output=output)
+    dst.flush()
+    return dst
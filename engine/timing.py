@@ -0,0 +1,212 @@
+"""Span timing for the filter pipeline, with Prometheus and JSON-lines export
+
+Wrap a stage in ``span``::
+
+    with span('encode', format='PNG'):
+        data = encode_image(image)
+
+Spans cost one boolean check unless timing is on. Timing is on for the
+whole process when the ``PICUPG_TIMING`` environment variable is set (or
+after ``enable()``), and always inside ``record()``, which also collects
+the spans of the current thread, plus any JobQueue jobs it submits, for
+display. Finished spans are aggregated into per-stage histograms
+(``prometheus_text`` / ``write_prometheus``). With ``PICUPG_TIMING_LOG``
+set, each span is also appended to that file as one JSON object per line.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger('picupg.timing')
+
+_enabled = bool(os.environ.get('PICUPG_TIMING'))
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(BUCKETS)})
+
+
+class Recorder:
+    """Spans finished while the recorder was active, in completion order"""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            self.spans.append(entry)
+
+    def rows(self):
+        """Spans in start order, for tabular display"""
+        with self._lock:
+            return sorted(self.spans, key=lambda entry: entry['start'])
+
+
+def enable(log_path=None):
+    """Turn timing on for the whole process, optionally logging spans to a file"""
+    global _enabled
+    _enabled = True
+    if log_path:
+        _add_log_file(log_path)
+
+
+def disable():
+    """Turn process-wide timing off (recorders still collect their own spans)"""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """Whether spans on the calling thread are currently measured"""
+    return _enabled or current_recorder() is not None
+
+
+def current_recorder():
+    """The recorder active on the calling thread, or None"""
+    return getattr(_local, 'recorder', None)
+
+
+def activate(recorder):
+    """Make recorder (or None) active on the calling thread; return the previous one
+
+    For code that cannot wrap its work in ``use_recorder``, such as a
+    Streamlit script body.
+    """
+    previous = current_recorder()
+    _local.recorder = recorder
+    _local.depth = 0
+    return previous
+
+
+@contextmanager
+def use_recorder(recorder):
+    """Make recorder active on the calling thread (used to follow work across threads)"""
+    previous_depth = getattr(_local, 'depth', 0)
+    previous = activate(recorder)
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+        _local.depth = previous_depth
+
+
+@contextmanager
+def record():
+    """Collect every span finished on this thread into a new Recorder"""
+    with use_recorder(Recorder()) as recorder:
+        yield recorder
+
+
+@contextmanager
+def span(name, **labels):
+    """Time the enclosed block as stage ``name``"""
+    recorder = current_recorder()
+    if not _enabled and recorder is None:
+        yield
+        return
+
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _local.depth = depth
+        entry = {
+            'stage': name,
+            'ms': round(seconds * 1000, 3),
+            'depth': depth,
+            'start': started_at,
+            'thread': threading.current_thread().name,
+            **labels,
+        }
+        _observe(name, seconds)
+        if recorder is not None:
+            recorder.add(entry)
+        if logger.handlers:
+            logger.info(json.dumps(entry))
+
+
+def timed(name):
+    """Decorator form of ``span``"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _observe(name, seconds):
+    with _stats_lock:
+        stats = _stats[name]
+        stats['count'] += 1
+        stats['sum'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][i] += 1
+
+
+def snapshot():
+    """Copy of the per-stage aggregates: count, sum, max and bucket counts"""
+    with _stats_lock:
+        return {name: {**stats, 'buckets': list(stats['buckets'])} for name, stats in _stats.items()}
+
+
+def reset():
+    """Forget all aggregated timings"""
+    with _stats_lock:
+        _stats.clear()
+
+
+def prometheus_text():
+    """Aggregated timings in the Prometheus text exposition format"""
+    lines = [
+        '# HELP picupg_stage_seconds Time spent in each pipeline stage.',
+        '# TYPE picupg_stage_seconds histogram',
+    ]
+    for name, stats in sorted(snapshot().items()):
+        # Bucket counts are already cumulative: each span lands in every bucket it fits
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append(f'picupg_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {count}')
+        lines.append(f'picupg_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stats["count"]}')
+        lines.append(f'picupg_stage_seconds_sum{{stage="{name}"}} {stats["sum"]:.6f}')
+        lines.append(f'picupg_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Atomically write ``prometheus_text`` to path, e.g. for node_exporter's textfile collector"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def _add_log_file(path):
+    path = str(Path(path).resolve())
+    if any(getattr(handler, 'baseFilename', None) == path for handler in logger.handlers):
+        return
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+if os.environ.get('PICUPG_TIMING_LOG'):
+    enable(os.environ['PICUPG_TIMING_LOG'])
@@ -0,0 +1,234 @@
+"""Streaming convolution of video clips and animated images
+
+Frames are decoded lazily (OpenCV ``VideoCapture`` for video, Pillow frame
+iteration for GIF), filtered on a thread pool with at most ``window``
+frames in flight, and handed to the encoder in their original order as
+soon as each one is ready. Memory therefore stays constant in the number
+of frames: a window of decoded frames plus the encoder's own state.
+
+Pillow's GIF writer keeps every (palettised) frame until the file is
+closed, so ``output_suffix`` only keeps GIF output for animations below
+GIF_OUTPUT_MAX_PIXELS in total and sends longer ones to MP4.
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+
+from .decompose import filter_block
+from .output import CLIP, check_output_mode
+from .tiling import to_rgb
+from .timing import timed
+
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v'}
+ANIMATION_EXTENSIONS = {'.gif'}
+
+# FourCC codes for the containers VideoWriter can produce here
+VIDEO_CODECS = {'.mp4': 'mp4v', '.m4v': 'mp4v', '.mov': 'mp4v', '.avi': 'MJPG', '.mkv': 'MJPG'}
+
+DEFAULT_FPS = 25.0
+
+# Animations with more pixels than this over all frames are written as MP4
+GIF_OUTPUT_MAX_PIXELS = 64_000_000
+
+
+def is_animation(path):
+    """Whether path should be read frame by frame with Pillow"""
+    return Path(path).suffix.lower() in ANIMATION_EXTENSIONS
+
+
+def clip_info(path):
+    """Return the info dict of ``open_clip`` without decoding any frames"""
+    if is_animation(path):
+        with Image.open(path) as image:
+            return _animation_info(image)
+    capture = cv2.VideoCapture(str(path))
+    try:
+        if not capture.isOpened():
+            raise ValueError(f"Cannot open video: {path}")
+        return _video_info(capture)
+    finally:
+        capture.release()
+
+
+def output_suffix(path):
+    """Container for a filtered clip: GIF for short animations, otherwise MP4"""
+    if is_animation(path):
+        info = clip_info(path)
+        if info['frame_count'] * info['width'] * info['height'] <= GIF_OUTPUT_MAX_PIXELS:
+            return '.gif'
+    return '.mp4'
+
+
+def open_clip(path):
+    """Return (frames, info) for a video or animated image
+
+    ``frames`` is a lazy iterator of (rgb_array, duration_ms) and ``info``
+    holds width, height, fps and frame_count (0 when unknown).
+    """
+    if is_animation(path):
+        return _open_animation(path)
+    return _open_video(path)
+
+
+def _open_video(path):
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    info = _video_info(capture)
+    fps = info['fps']
+
+    def frames():
+        try:
+            while True:
+                ok, bgr = capture.read()
+                if not ok:
+                    return
+                yield cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), 1000.0 / fps
+        finally:
+            capture.release()
+
+    return frames(), info
+
+
+def _video_info(capture):
+    return {
+        'width': int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'fps': capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS,
+        'frame_count': max(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), 0),
+    }
+
+
+def _animation_info(image):
+    duration = image.info.get('duration') or 1000.0 / DEFAULT_FPS
+    return {
+        'width': image.size[0],
+        'height': image.size[1],
+        'fps': 1000.0 / duration,
+        'frame_count': getattr(image, 'n_frames', 1),
+        'loop': image.info.get('loop', 0),
+    }
+
+
+def _open_animation(path):
+    image = Image.open(path)
+    info = _animation_info(image)
+    duration = 1000.0 / info['fps']
+
+    def frames():
+        try:
+            for frame in ImageSequence.Iterator(image):
+                # Palette frames composite onto the previous one; RGBA keeps that
+                rgb = to_rgb(np.asarray(frame.convert('RGBA')))
+                yield rgb, frame.info.get('duration', duration)
+        finally:
+            image.close()
+
+    return frames(), info
+
+
+def filter_frames(frames, kernel, workers=None, window=None, output=CLIP, executor=None):
+    """Filter (rgb, duration) frames concurrently, yielding results in input order
+
+    At most ``window`` frames (default twice the worker count) are decoded
+    but not yet yielded at any time. With ``output='minmax'`` each frame is
+    stretched by its own response range.
+    """
+    check_output_mode(output)
+    workers = workers or 1
+    window = window or 2 * workers
+    pool = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix='video-frame')
+    pending = deque()
+    try:
+        for frame, duration in frames:
+            pending.append((pool.submit(_filter_frame, frame, kernel, output), duration))
+            if len(pending) >= window:
+                future, duration = pending.popleft()
+                yield future.result(), duration
+        while pending:
+            future, duration = pending.popleft()
+            yield future.result(), duration
+    finally:
+        for future, _ in pending:
+            future.cancel()
+        if executor is None:
+            pool.shutdown()
+
+
+@timed('video_frame')
+def _filter_frame(frame, kernel, output):
+    return filter_block(frame, kernel, output=output)
+
+
+def convolve_clip(src_path, dst_path, kernel, workers=None, window=None, output=CLIP, progress=None):
+    """Filter every frame of a clip or animated image into dst_path
+
+    The output container follows dst_path's extension: .gif is written
+    with Pillow (keeping per-frame durations), anything in
+    VIDEO_CODECS with OpenCV's VideoWriter. ``progress(done, total)`` is
+    called after each frame is written; total is 0 when unknown. Returns
+    a dict with frames, seconds and fps.
+    """
+    frames, info = open_clip(src_path)
+    filtered = filter_frames(frames, kernel, workers=workers, window=window, output=output)
+    total = info['frame_count']
+    done = 0
+    start = time.perf_counter()
+
+    def counted(results):
+        nonlocal done
+        for result in results:
+            yield result
+            done += 1
+            if progress is not None:
+                progress(done, total)
+
+    suffix = Path(dst_path).suffix.lower()
+    if suffix == '.gif':
+        _write_animation(dst_path, counted(filtered), info)
+    elif suffix in VIDEO_CODECS:
+        _write_video(dst_path, counted(filtered), info, VIDEO_CODECS[suffix])
+    else:
+        raise ValueError(f"Unsupported output container: {suffix}")
+
+    seconds = time.perf_counter() - start
+    return {
+        'frames': done,
+        'seconds': seconds,
+        'fps': done / seconds if seconds > 0 else 0.0,
+        'width': info['width'],
+        'height': info['height'],
+    }
+
+
+def _write_video(dst_path, frames, info, codec):
+    writer = cv2.VideoWriter(
+        str(dst_path), cv2.VideoWriter_fourcc(*codec), info['fps'], (info['width'], info['height'])
+    )
+    if not writer.isOpened():
+        raise ValueError(f"Cannot write video with codec {codec}: {dst_path}")
+    try:
+        for frame, _ in frames:
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    finally:
+        writer.release()
+
+
+def _write_animation(dst_path, frames, info):
+    def images():
+        for frame, duration in frames:
+            image = Image.fromarray(frame)
+            # Without an explicit duration Pillow uses each frame's own
+            image.info['duration'] = duration
+            yield image
+
+    images = images()
+    first = next(images, None)
+    if first is None:
+        raise ValueError("Clip has no frames")
+    first.save(dst_path, format='GIF', save_all=True, append_images=images, loop=info.get('loop', 0))
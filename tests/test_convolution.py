@@ -0,0 +1,17 @@
+"""The convolution probe must agree with dense filtering at the pixel it shows"""
+import cv2
+import numpy as np
+import pytest
+
+from engine.convolution import get_sample_region_calculation
+
+
+@pytest.mark.parametrize('shape', [(5, 5), (1, 1), (3, 12), (40, 50)])
+def test_probe_matches_dense(shape):
+    image = np.random.default_rng(1).integers(0, 256, shape, dtype=np.uint8)
+    kernel = np.random.default_rng(2).standard_normal((9, 9)).astype(np.float32)
+    sample = get_sample_region_calculation(image, kernel)
+    x, y = sample['position']
+    expected = cv2.filter2D(image.astype(np.float32), cv2.CV_32F, kernel, borderType=cv2.BORDER_REFLECT_101)[y, x]
+    assert sample['region'].shape == kernel.shape
+    assert sample['total'] == pytest.approx(expected, abs=1e-3)
@@ -0,0 +1,100 @@
+"""Every kernel plan, and every way of scheduling it, must match dense filtering"""
+import cv2
+import numpy as np
+import pytest
+
+from engine.decompose import BOX, CENTER_BOX, FFT, LOW_RANK, SEPARABLE, analyse_kernel, filter_block
+from engine.fused import convolve_fused
+from engine.tiling import convolve_parallel, convolve_tiled
+
+
+def gaussian(rows, cols, sigma=1.5):
+    return (cv2.getGaussianKernel(rows, sigma) @ cv2.getGaussianKernel(cols, sigma).T).astype(np.float32)
+
+
+def centre_box(size, centre, weight):
+    kernel = np.full((size, size), weight, dtype=np.float32)
+    kernel[size // 2, size // 2] = centre
+    return kernel
+
+
+def low_rank(size):
+    rng = np.random.default_rng(3)
+    kernel = sum(np.outer(rng.standard_normal(size), rng.standard_normal(size)) for _ in range(2))
+    return (kernel / np.abs(kernel).sum()).astype(np.float32)
+
+
+def dense_random(rows, cols, seed=4):
+    kernel = np.random.default_rng(seed).standard_normal((rows, cols))
+    return (kernel / np.abs(kernel).sum() * 2).astype(np.float32)
+
+
+KERNELS = {
+    'box_3x3': (np.ones((3, 3), np.float32) / 9, BOX),
+    'box_4x4': (np.ones((4, 4), np.float32) / 16, BOX),
+    'box_5x2': (np.ones((5, 2), np.float32) / 10, BOX),
+    'centre_box_5x5': (centre_box(5, 25.0, -1.0), CENTER_BOX),
+    'centre_box_6x6': (centre_box(6, 20.0, -0.5), CENTER_BOX),
+    'separable_7x7': (gaussian(7, 7), SEPARABLE),
+    'separable_4x6': (gaussian(4, 6), SEPARABLE),
+    'low_rank_15x15': (low_rank(15), LOW_RANK),
+    'low_rank_16x16': (low_rank(16), LOW_RANK),
+    'fft_41x41': (dense_random(41, 41), FFT),
+    'fft_32x36': (dense_random(32, 36), FFT),
+}
+
+
+@pytest.fixture(scope='module')
+def image():
+    rng = np.random.default_rng(0)
+    smooth = cv2.resize(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8), (160, 120), interpolation=cv2.INTER_CUBIC)
+    return np.clip(smooth.astype(np.int16) + rng.integers(-20, 21, smooth.shape), 0, 255).astype(np.uint8)
+
+
+def dense_response(image, kernel):
+    return cv2.filter2D(image.astype(np.float32), cv2.CV_32F, kernel, borderType=cv2.BORDER_REFLECT_101)
+
+
+@pytest.mark.parametrize('name', sorted(KERNELS))
+def test_plan_method(name):
+    kernel, method = KERNELS[name]
+    assert analyse_kernel(kernel)['method'] == method
+
+
+@pytest.mark.parametrize('name', sorted(KERNELS))
+def test_clip_matches_dense(image, name):
+    kernel, _ = KERNELS[name]
+    expected = np.clip(np.rint(dense_response(image, kernel)), 0, 255)
+    result = filter_block(image, kernel)
+    # Float association order differs between passes; allow one level of rounding
+    assert np.abs(result.astype(np.int16) - expected).max() <= 1
+
+
+@pytest.mark.parametrize('name', sorted(KERNELS))
+def test_abs_matches_dense(image, name):
+    kernel, _ = KERNELS[name]
+    expected = np.clip(np.rint(np.abs(dense_response(image, kernel))), 0, 255)
+    result = filter_block(image, kernel, output='abs')
+    assert np.abs(result.astype(np.int16) - expected).max() <= 1
+
+
+@pytest.mark.parametrize('output', ['clip', 'abs', 'minmax'])
+@pytest.mark.parametrize('name', sorted(KERNELS))
+def test_tiled_and_parallel_match_whole_image(image, name, output):
+    kernel, method = KERNELS[name]
+    whole = filter_block(image, kernel, output=output).astype(np.int16)
+    tiled = convolve_tiled(image, kernel, strip_rows=37, output=output)
+    parallel = convolve_parallel(image, kernel, workers=3, strip_rows=29, output=output)
+    # FFT rounding depends on the block size (see engine.tiling); all other plans are exact
+    tolerance = 1 if method == FFT else 0
+    assert np.abs(tiled - whole).max() <= tolerance
+    assert np.abs(parallel - whole).max() <= tolerance
+
+
+@pytest.mark.parametrize('output', ['clip', 'abs', 'minmax'])
+def test_fused_matches_separate_passes(image, output):
+    kernels = list(KERNELS.values())
+    fused = convolve_fused(image, [kernel for kernel, _ in kernels], strip_rows=41, output=output)
+    for (kernel, method), result in zip(kernels, fused):
+        tolerance = 1 if method == FFT else 0
+        assert np.abs(result.astype(np.int16) - filter_block(image, kernel, output=output)).max() <= tolerance
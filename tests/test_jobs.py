@@ -0,0 +1,119 @@
+"""Scheduling, backpressure, cancellation and retention of the job queue"""
+import threading
+
+import numpy as np
+import pytest
+
+from engine.jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, CancelledJob, JobQueue, QueueFull
+
+
+@pytest.fixture
+def gate():
+    """An event the first job blocks on, so later jobs stay queued"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(workers=1, max_pending=4)
+    yield queue
+    queue.shutdown()
+
+
+def start_blocker(queue, gate):
+    started = threading.Event()
+
+    def block():
+        started.set()
+        gate.wait(5)
+
+    job_id = queue.submit(block, owner='blocker')
+    assert started.wait(5)
+    return job_id
+
+
+def test_owners_are_served_round_robin(queue, gate):
+    blocker = start_blocker(queue, gate)
+    order = []
+    jobs = [queue.submit(order.append, 'a1', owner='a'), queue.submit(order.append, 'a2', owner='a'),
+            queue.submit(order.append, 'a3', owner='a'), queue.submit(order.append, 'b1', owner='b')]
+    gate.set()
+    queue.result(blocker, timeout=5)
+    for job_id in jobs:
+        queue.result(job_id, timeout=5)
+    assert order == ['a1', 'b1', 'a2', 'a3']
+
+
+def test_submit_raises_when_pending_is_full(queue, gate):
+    start_blocker(queue, gate)
+    for _ in range(queue.max_pending):
+        queue.submit(lambda: None)
+    with pytest.raises(QueueFull):
+        queue.submit(lambda: None)
+
+
+def test_cancel_only_affects_queued_jobs(queue, gate):
+    blocker = start_blocker(queue, gate)
+    job_id = queue.submit(lambda: 1)
+    assert queue.status(blocker) == RUNNING
+    assert queue.status(job_id) == QUEUED
+    assert not queue.cancel(blocker)
+    assert queue.cancel(job_id)
+    assert queue.status(job_id) == CANCELLED
+    assert queue.pending == 0
+    with pytest.raises(CancelledJob):
+        queue.result(job_id)
+
+
+def test_result_reraises_the_job_error(queue):
+    job_id = queue.submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        queue.result(job_id, timeout=5)
+    assert queue.status(job_id) == FAILED
+
+
+def test_forget_finished_job(queue):
+    job_id = queue.submit(lambda: np.zeros(100, np.uint8))
+    queue.result(job_id, timeout=5)
+    assert queue.finished_nbytes == 100
+    queue.forget(job_id)
+    assert queue.finished_nbytes == 0
+    with pytest.raises(KeyError):
+        queue.status(job_id)
+
+
+def test_forget_running_job_discards_its_result(queue, gate):
+    blocker = start_blocker(queue, gate)
+    queue.forget(blocker)
+    gate.set()
+    # The next job runs on the same worker, so the blocker has finished by then
+    queue.result(queue.submit(lambda: None), timeout=5)
+    with pytest.raises(KeyError):
+        queue.status(blocker)
+
+
+def test_finished_results_are_bounded_by_bytes():
+    queue = JobQueue(workers=1, max_finished_bytes=250)
+    try:
+        jobs = [queue.submit(np.zeros, 100, np.uint8) for _ in range(4)]
+        queue.result(jobs[-1], timeout=5)
+        assert queue.finished_nbytes <= 250
+        with pytest.raises(KeyError):
+            queue.status(jobs[0])
+        assert queue.status(jobs[-1]) == DONE
+    finally:
+        queue.shutdown()
+
+
+def test_finished_results_expire():
+    queue = JobQueue(workers=1, finished_ttl=0)
+    try:
+        first = queue.submit(lambda: 1)
+        queue.result(first, timeout=5)
+        queue.result(queue.submit(lambda: 2), timeout=5)
+        with pytest.raises(KeyError):
+            queue.status(first)
+    finally:
+        queue.shutdown()
@@ -0,0 +1,45 @@
+"""Upload store references, expiry and re-registration"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from engine.store import ImageStore
+
+
+@pytest.fixture
+def data():
+    buf = io.BytesIO()
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_owners_share_one_entry(data):
+    store = ImageStore()
+    _, first = store.acquire(data, 'a')
+    _, second = store.acquire(data, 'b')
+    assert first is second
+    assert len(store) == 1
+
+
+def test_touch_reports_an_expired_owner(data):
+    store = ImageStore(owner_ttl=0)
+    store.acquire(data, 'a')
+    assert not store.touch('a')
+    assert len(store) == 0
+
+    # Acquiring again puts the upload back under the store's budget
+    store.owner_ttl = 3600
+    _, derived = store.acquire(data, 'a')
+    derived.rgb
+    assert store.touch('a')
+    assert store.nbytes >= derived.nbytes > 0
+
+
+def test_release_frees_unreferenced_uploads(data):
+    store = ImageStore()
+    store.acquire(data, 'a')
+    store.release('a')
+    assert len(store) == 0
+    assert not store.touch('a')
@@ -0,0 +1,30 @@
+"""Every PIL mode reaches the filters as L, RGB or RGBA uint8 pixels"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from engine.tiling import normalize_mode
+
+
+def test_32_bit_integers_are_clipped():
+    image = Image.fromarray(np.array([[-5, 0, 100, 255, 300]], dtype=np.int32), 'I')
+    assert np.asarray(normalize_mode(image)).tolist() == [[0, 0, 100, 255, 255]]
+
+
+def test_8_bit_values_survive_a_convert_to_i():
+    gray = Image.fromarray(np.arange(256, dtype=np.uint8).reshape(16, 16))
+    assert np.array_equal(np.asarray(normalize_mode(gray.convert('I'))), np.asarray(gray))
+
+
+def test_16_bit_samples_keep_the_high_byte():
+    image = Image.fromarray(np.array([[0, 255, 256, 65535]], dtype=np.uint16))
+    assert image.mode.startswith('I;16')
+    assert np.asarray(normalize_mode(image)).tolist() == [[0, 0, 1, 255]]
+
+
+@pytest.mark.parametrize('mode', ['1', 'P', 'LA', 'CMYK', 'F'])
+def test_other_modes_become_rgb(mode):
+    image = Image.new('RGB', (4, 3), (10, 20, 30)).convert(mode)
+    normalized = normalize_mode(image)
+    assert normalized.mode == 'RGB'
+    assert np.asarray(normalized).dtype == np.uint8